@@ -8,11 +8,18 @@ import shutil
 import os
 import yaml
 
+import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 
+from analyzers.fairness_analyzer import FairnessAnalyzer
 from analyzers.pcap_analyzer import PCAPAnalyzer
 from analyzers.flow_analyzer import SingleFlowAnalyzer
+from analyzers.plot_cache import PlotCache
+from analyzers.sketch import DDSketch
+from analyzers.windows import RateWindow, add_rate_window_args, rate_window
 from jinja2 import Environment, FileSystemLoader
+from matplotlib.ticker import EngFormatter
 from pathlib import Path
 
 
@@ -27,9 +34,13 @@ def read_capacity(file):
 
 
 class SingleExperimentAnalyzer():
-    def __init__(self, input_dir, output_dir):
+    def __init__(self, input_dir, output_dir, plot_cache=None, plots=True,
+                 rate_window=RateWindow()):
         self._directory = input_dir
         self._output = output_dir
+        self._plot_cache = plot_cache
+        self._plots = plots
+        self._rate_window = rate_window
         self._plot_files = []
         self._aggregates = {}
 
@@ -57,19 +68,57 @@ class SingleExperimentAnalyzer():
 
         flows = [flow for flow in c['flows']]
         flow_plots = []
+        fairness = FairnessAnalyzer(self._output, link, self._rate_window)
+        summaries = {}
         for flow in flows:
             if 'id' in flow:
                 out = os.path.join(self._output, str(flow['id']))
-                fa = SingleFlowAnalyzer(flow, out, self._basetime)
+                fa = SingleFlowAnalyzer(
+                        flow, out, self._basetime, self._plot_cache,
+                        self._rate_window)
                 fa.set_link_capacity(link)
+                fa.set_events(c.get('events', []))
                 fa.analyze()
-                fa.plot()
+                fa.save_sketches()
+                fa.save_rollups()
+                if self._plots:
+                    fa.plot()
                 flow_plots.append({
                     'id': str(flow['id']),
                     'plots': [{
                         'file_name': Path(pf).relative_to(Path(self._output)),
                     } for pf in fa.plot_files],
                 })
+                summaries[str(flow['id'])] = fa.summary()
+                rtcp = fa.rtcp_json()
+                if len(rtcp) > 0:
+                    feedback = self._aggregates.setdefault('rtcp', {})
+                    feedback[str(flow['id'])] = rtcp
+                if len(fa.profiles) > 0:
+                    profiles = self._aggregates.setdefault('profiles', {})
+                    profiles[str(flow['id'])] = fa.profiles
+                percentiles = fa.latency_percentiles_json()
+                if percentiles is not None:
+                    latency = self._aggregates.setdefault(
+                            'latency_percentiles', {})
+                    latency[str(flow['id'])] = percentiles
+                packets = fa.received_packets()
+                if packets is not None:
+                    fairness.add_flow(flow['id'], *packets)
+
+        self.save_summary(summaries)
+
+        fairness.analyze()
+        if self._plots:
+            fairness.plot()
+        self._aggregates['fairness'] = fairness.aggregates()
+        if len(fairness.plot_files) > 0:
+            flow_plots.append({
+                'id': 'all flows',
+                'plots': [{
+                    'file_name': Path(pf).relative_to(Path(self._output)),
+                } for pf in fairness.plot_files],
+            })
 
         # self.analyze_pcap(files)
 
@@ -84,6 +133,22 @@ class SingleExperimentAnalyzer():
         a = PCAPAnalyzer()
         a.read(pcap)
 
+    def save_summary(self, flows):
+        summary = {
+            'emulation': self._config['emulation'].get('parameters', {}),
+            'flows': {
+                id: {
+                    'parameters': next(
+                        (f.get('parameters', {}) for f in self._config['flows']
+                         if str(f.get('id')) == id), {}),
+                    'quantiles': quantiles,
+                } for id, quantiles in flows.items()
+            },
+        }
+        filename = os.path.join(self._output, 'summary.json')
+        with open(filename, mode='w', encoding='utf-8') as f:
+            json.dump(summary, f)
+
     def save_aggregates(self):
         filename = os.path.join(self._output, 'aggregates.json')
         with open(filename, mode='w', encoding='utf-8') as f:
@@ -104,6 +169,15 @@ class SingleExperimentAnalyzer():
             f.write(content)
 
 
+def correlation(rows, x, y):
+    # Pearson correlation of two keys over the rows that have both
+    pairs = np.array([(r[x], r[y]) for r in rows
+                      if r[x] is not None and r[y] is not None], dtype=float)
+    if len(pairs) < 3 or np.any(np.std(pairs, axis=0) == 0):
+        return None
+    return float(np.corrcoef(pairs[:, 0], pairs[:, 1])[0, 1])
+
+
 def to_pretty_json(value):
     data = json.dumps(value, sort_keys=True,
                       indent=4, separators=(',', ': '))
@@ -112,10 +186,178 @@ def to_pretty_json(value):
 
 class AggregateAnalyzer():
     def __init__(self, args):
-        pass
+        self._input = args.input_dir
+        self._output = args.output_dir
+        self._group_by = args.group_by
 
     def analyze(self):
-        pass
+        # root config -> group -> metric -> list of quantile vectors
+        groups = {}
+        for file in glob.glob(self._input + '/**/summary.json',
+                              recursive=True):
+            root = Path(file).relative_to(self._input).parts[0]
+            with open(file) as f:
+                summary = json.load(f)
+            for flow in summary['flows'].values():
+                value = flow['parameters'].get(
+                        self._group_by,
+                        summary['emulation'].get(self._group_by))
+                if value is None:
+                    continue
+                group = groups.setdefault(root, {}).setdefault(str(value), {})
+                for metric, q in flow['quantiles'].items():
+                    if len(q) > 0:
+                        group.setdefault(metric, []).append(q)
+
+        for root, root_groups in groups.items():
+            out = os.path.join(self._output, root)
+            Path(out).mkdir(parents=True, exist_ok=True)
+            self.plot_cdfs(root, root_groups, out)
+
+        self.merge_sketches()
+        self.correlate_profiles()
+
+    def correlate_profiles(self):
+        # root config -> profile name -> one row per profiled flow
+        rows = {}
+        for file in glob.glob(self._input + '/**/aggregates.json',
+                              recursive=True):
+            experiment = Path(file).parent
+            summary_file = experiment / 'summary.json'
+            if not summary_file.is_file():
+                continue
+            with open(file) as f:
+                aggregates = json.load(f)
+            with open(summary_file) as f:
+                summary = json.load(f)
+
+            root = Path(file).relative_to(self._input).parts[0]
+            for id, profiles in aggregates.get('profiles', {}).items():
+                flow = summary['flows'].get(id)
+                if flow is None:
+                    continue
+                throughput = flow['quantiles'].get('throughput', [])
+                latency = flow['quantiles'].get('latency', [])
+                for name, profile in profiles.items():
+                    duration = profile['duration_s']
+                    rows.setdefault(root, {}).setdefault(name, []).append({
+                        'experiment': str(
+                            experiment.relative_to(self._input)),
+                        'flow': id,
+                        'total': profile['total'],
+                        # e.g. CPU cores for cpu, bytes/s for allocs
+                        'rate': profile['total'] / duration
+                        if duration > 0 else None,
+                        'throughput_p50': throughput[50]
+                        if len(throughput) > 50 else None,
+                        'latency_p95': latency[95]
+                        if len(latency) > 95 else None,
+                        'top': profile['top'],
+                    })
+
+        for root, profiles in rows.items():
+            result = {}
+            for name, flows in profiles.items():
+                functions = {}
+                for flow in flows:
+                    for function in flow.pop('top'):
+                        functions[function['function']] = functions.get(
+                                function['function'], 0) + function['flat']
+                top = sorted(functions, key=functions.get, reverse=True)
+                result[name] = {
+                    'correlation': {
+                        kpi: correlation(flows, 'rate', kpi)
+                        for kpi in ['throughput_p50', 'latency_p95']
+                    },
+                    'top': [{
+                        'function': function,
+                        'flat': functions[function],
+                    } for function in top[:10]],
+                    'flows': flows,
+                }
+            Path(self._output, root).mkdir(parents=True, exist_ok=True)
+            name = os.path.join(self._output, root, 'profiles.json')
+            with open(name, 'w') as f:
+                json.dump(result, f, indent=4)
+            print('saved {}'.format(name))
+
+    def merge_sketches(self):
+        # root config -> group -> metric -> merged sketch
+        merged = {}
+        for file in glob.glob(self._input + '/**/sketches.json',
+                              recursive=True):
+            flow_dir = Path(file).parent
+            summary_file = flow_dir.parent / 'summary.json'
+            if not summary_file.is_file():
+                continue
+            with open(summary_file) as f:
+                summary = json.load(f)
+            flow = summary['flows'].get(flow_dir.name)
+            if flow is None:
+                continue
+            value = flow['parameters'].get(
+                    self._group_by, summary['emulation'].get(self._group_by))
+            if value is None:
+                continue
+
+            root = Path(file).relative_to(self._input).parts[0]
+            group = merged.setdefault(root, {}).setdefault(str(value), {})
+            with open(file) as f:
+                sketches = json.load(f)
+            for metric, data in sketches.items():
+                sketch = DDSketch.from_json(data)
+                if metric in group:
+                    group[metric].merge(sketch)
+                else:
+                    group[metric] = sketch
+
+        for root, groups in merged.items():
+            percentiles = {
+                group: {
+                    metric: {
+                        'unit': sketch.unit,
+                        'count': sketch.count,
+                    } | sketch.percentiles()
+                    for metric, sketch in metrics.items()
+                } for group, metrics in groups.items()
+            }
+            Path(self._output, root).mkdir(parents=True, exist_ok=True)
+            name = os.path.join(
+                    self._output, root, f'percentiles_{self._group_by}.json')
+            with open(name, 'w') as f:
+                json.dump(percentiles, f, indent=4)
+            print('saved {}'.format(name))
+
+    def plot_cdfs(self, root, groups, out):
+        metrics = {
+            'latency': ('Latency', EngFormatter(unit='s')),
+            'throughput': ('Throughput', EngFormatter(unit='bit/s')),
+            'vmaf': ('VMAF', None),
+        }
+        fig, axs = plt.subplots(
+                ncols=len(metrics), figsize=(15, 4), dpi=200)
+        for ax, (metric, (title, formatter)) in zip(axs, metrics.items()):
+            for name, group in sorted(groups.items()):
+                if metric not in group:
+                    continue
+                # Every experiment contributes its quantiles with equal
+                # weight to the pooled distribution.
+                values = np.sort(np.concatenate(group[metric]))
+                cdf = np.arange(1, len(values) + 1) / len(values)
+                ax.plot(values, cdf, linewidth=0.8,
+                        label=f'{name} (n={len(group[metric])})')
+            ax.set_title(f'{title} CDF by {self._group_by}')
+            ax.set_xlabel(title)
+            ax.set_ylabel('CDF')
+            if formatter is not None:
+                ax.xaxis.set_major_formatter(formatter)
+            if ax.has_data():
+                ax.legend(fontsize='small')
+        fig.suptitle(root)
+        name = os.path.join(out, f'cdf_{self._group_by}.png')
+        fig.savefig(name, bbox_inches='tight')
+        plt.close(fig)
+        print('saved {}'.format(name))
 
 
 def read_config_yaml(path):
@@ -132,22 +374,23 @@ def read_config_json(path):
     return c
 
 
-def create_index(args):
-    config_file = os.path.join(args.input_dir, 'config.yaml')
+def index_configs(input_dir, output_dir):
+    config_file = os.path.join(input_dir, 'config.yaml')
     if not os.path.isfile(config_file):
         print('config.yaml not found, aborting')
+        return []
 
     main_configs = read_config_yaml(config_file)
 
     configs = []
     for name, config in main_configs.items():
-        root_dir = os.path.join(args.input_dir, name)
+        root_dir = os.path.join(input_dir, name)
         dirs = [d for d in glob.glob(root_dir + '/**', recursive=True)
                 if os.path.isdir(d) and
                 any(fname.endswith('config.json')
                     for fname in os.listdir(d))]
         paths = [{
-            'path': Path(d).relative_to(args.output_dir),
+            'path': Path(d).relative_to(output_dir),
             'config': read_config_json(os.path.join(d, 'config.json')),
         } for d in dirs]
         if len(paths) == 0:
@@ -186,12 +429,15 @@ def create_index(args):
             'headers': ['Link'] + e_headers + f_headers,
             'experiments': experiments,
         })
+    return configs
+
 
+def create_index(args):
     environment = Environment(loader=FileSystemLoader('templates/'))
     template = environment.get_template('index.html')
 
     context = {
-        'evaluated_configs': configs,
+        'evaluated_configs': index_configs(args.input_dir, args.output_dir),
     }
     content = template.render(context)
     filename = os.path.join(args.output_dir, 'index.html')
@@ -201,7 +447,17 @@ def create_index(args):
 
 def run_single(args):
     Path(args['output_dir']).mkdir(parents=True, exist_ok=True)
-    SingleExperimentAnalyzer(args['input_dir'], args['output_dir']).analyze()
+    plot_cache = None
+    if args['plot_cache'] is not None:
+        plot_cache = PlotCache(
+                args['plot_cache'], args['plot_cache_size'] * 1024 * 1024)
+    SingleExperimentAnalyzer(
+            args['input_dir'],
+            args['output_dir'],
+            plot_cache,
+            args['plots'],
+            args['rate_window'],
+        ).analyze()
 
 
 def analyze_single(args):
@@ -222,6 +478,10 @@ def analyze_single(args):
             'input_dir': dir,
             'output_dir': os.path.join(
                 args.output_dir, str(Path(dir).relative_to(args.input_dir))),
+            'plot_cache': args.plot_cache,
+            'plot_cache_size': args.plot_cache_size,
+            'plots': not args.no_plots,
+            'rate_window': rate_window(args),
             } for dir in dirs]
     pool.map(
         run_single,
@@ -242,11 +502,25 @@ def main():
     single = subparsers.add_parser(
             'single',
             help='analyze a single experiment')
+    single.add_argument('--plot-cache',
+                        help='directory of a plot cache shared between runs, '
+                        'plots with unchanged inputs and code are copied '
+                        'from it instead of being rendered')
+    single.add_argument('--plot-cache-size', type=int, default=1024,
+                        help='maximum size of the plot cache in MiB')
+    single.add_argument('--no-plots', action='store_true',
+                        help='only compute summaries and aggregates, plots '
+                        'can be rendered on demand by serve.py')
+    add_rate_window_args(single)
     single.set_defaults(func=analyze_single)
 
     aggregate = subparsers.add_parser(
             'aggregate',
-            help='analyze a set of experiments')
+            help='compare experiments analyzed by single, reads the summary '
+            'files from the input directory')
+    aggregate.add_argument('--group-by', default='transport',
+                           help='flow or emulation parameter to group by, '
+                           'e.g. transport, transport-cc or loss')
     aggregate.set_defaults(func=analyze_aggregate)
 
     index = subparsers.add_parser(
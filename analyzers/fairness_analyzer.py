@@ -0,0 +1,104 @@
+import os
+
+from matplotlib.dates import DateFormatter
+from matplotlib.ticker import EngFormatter
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from analyzers.windows import RateWindow, to_ms, window_sums
+
+
+class FairnessAnalyzer():
+    def __init__(self, output_dir, link, rate_window=RateWindow()):
+        self.output_dir = output_dir
+        self.rate_window = rate_window
+        self.link = link
+        self.plot_files = []
+        self._ids = []
+        self._packets = []
+
+        self.starts: np.ndarray = None
+        self.rates: np.ndarray = None
+        self.capacity: np.ndarray = None
+        self.jain: np.ndarray = None
+        self.shares: np.ndarray = None
+        self.utilization: np.ndarray = None
+
+    def add_flow(self, id, times, sizes):
+        self._ids.append(str(id))
+        self._packets.append((times, sizes))
+
+    def analyze(self):
+        if len(self._packets) == 0:
+            return
+        end = max((t.max() for t, _ in self._packets if len(t) > 0),
+                  default=0)
+
+        # flows x windows matrix of rates in bit/s, all flows share the
+        # windows starting at the beginning of the run
+        windows = [
+            window_sums(times, sizes, self.rate_window, 0, end)
+            for times, sizes in self._packets]
+        starts = windows[0][0]
+        self.starts = starts
+        self.rates = np.stack([sums for _, sums in windows]) * 8 * 1000 / \
+            self.rate_window.window
+
+        link_times = to_ms(self.link.index)
+        link_rates = self.link['bandwidth'].to_numpy()
+        index = np.searchsorted(link_times, starts, side='right') - 1
+        self.capacity = link_rates[np.maximum(index, 0)].astype(float)
+
+        total = self.rates.sum(axis=0)
+        squares = (self.rates ** 2).sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.jain = np.where(
+                    squares > 0,
+                    total ** 2 / (len(self._ids) * squares),
+                    np.nan)
+            self.shares = self.rates / self.capacity
+            self.utilization = total / self.capacity
+
+    def aggregates(self):
+        if self.rates is None:
+            return {}
+        return {
+            'jain_mean': float(np.nanmean(self.jain)),
+            'utilization_mean': float(np.nanmean(self.utilization)),
+            'share_mean': {
+                id: float(np.nanmean(share))
+                for id, share in zip(self._ids, self.shares)
+            },
+        }
+
+    def plot(self):
+        if self.rates is None:
+            return
+        index = pd.to_datetime(self.starts, unit='ms')
+        fig, (ax, ax_j) = plt.subplots(
+                nrows=2, figsize=(8, 4), dpi=400, sharex=True)
+        ax.stackplot(
+                index, self.rates, labels=self._ids, step='post',
+                linewidth=0.5)
+        ax.step(
+                index, self.capacity, where='post', linewidth=0.5,
+                color='black', label='Capacity')
+        ax.set_ylabel('Rate')
+        ax.set_title('Received Throughput per Flow')
+        ax.yaxis.set_major_formatter(EngFormatter(unit='bit/s'))
+        ax.legend(fontsize='small', ncol=min(len(self._ids) + 1, 8))
+
+        ax_j.plot(index, self.jain, linewidth=0.5, label='Jain Index')
+        ax_j.plot(
+                index, self.utilization, linewidth=0.5, label='Utilization')
+        ax_j.set_xlabel('Time')
+        ax_j.set_title('Fairness and Utilization')
+        ax_j.xaxis.set_major_formatter(DateFormatter("%M:%S"))
+        ax_j.legend()
+
+        name = os.path.join(self.output_dir, 'fairness.png')
+        self.plot_files.append(name)
+        fig.savefig(name, bbox_inches='tight')
+        plt.close(fig)
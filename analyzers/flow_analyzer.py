@@ -1,3 +1,4 @@
+import json
 import os
 
 from pathlib import Path
@@ -8,16 +9,50 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
+from analyzers.iperf3_analyzer import Iperf3Analyzer
+from analyzers.plot_cache import cached_plot, data_hash
+from analyzers.pprof_analyzer import PROFILE_VALUES, read_profile
 from analyzers.qlog_analyzer import QLOGAnalyzer
+from analyzers.rollup import save_rollups
+from analyzers.rtcp_analyzer import FEEDBACK_RECEIVED, FEEDBACK_SENT, \
+    RTCPAnalyzer
+from analyzers.sketch import DDSketch, rolling_quantiles
+from analyzers.windows import RateWindow, to_ms, window_rate, window_sums
+
+
+PLOTS = [
+    'plot_rtp_throughput',
+    'plot_iperf3_throughput',
+    'plot_scream_cwnd',
+    'plot_scream_delays',
+    'plot_scream_rates',
+    'plot_rtp_utilization',
+    'plot_rtp_departure_arrival',
+    'plot_rtp_loss',
+    'plot_rtcp_feedback',
+    'plot_rtp_latency',
+    'plot_rtp_latency_percentiles',
+    'plot_rtp_latency_hist',
+    'plot_qlog',
+    'plot_video_quality',
+]
+
+LATENCY_PERCENTILES = [50, 95, 99]
+PROFILE_TOP = 10
 
 
 class SingleFlowAnalyzer():
-    def __init__(self, flow, output_dir, basetime):
+    def __init__(self, flow, output_dir, basetime, plot_cache=None,
+                 rate_window=RateWindow()):
         self.config = flow
         self.basetime = basetime
         self.input_dir = flow['log_dir']
         self.output_dir = output_dir
         self.plot_files = []
+        self.plot_cache = plot_cache
+        self.rate_window = rate_window
+        self.start = None
+        self._input_hashes = {}
 
         self.link: pd.DataFrame = None
         self.scream: pd.DataFrame = None
@@ -25,20 +60,176 @@ class SingleFlowAnalyzer():
         self.outgoing_rtp: pd.DataFrame = None
         self.incoming_rtp: pd.DataFrame = None
         self.loss: pd.DataFrame = None
+        self.lost: pd.Series = None
         self.latency: pd.DataFrame = None
+        self.latency_percentiles: pd.DataFrame = None
         self.rtp_utilization: pd.DataFrame = None
         self.qlog_server: QLOGAnalyzer = None
         self.qlog_client: QLOGAnalyzer = None
         self.video_quality_df: pd.DataFrame = None
+        self.iperf3_sent: pd.DataFrame = None
+        self.iperf3_received: pd.DataFrame = None
+        self.rtcp_sent: RTCPAnalyzer = None
+        self.rtcp_received: RTCPAnalyzer = None
+        self.reactions: np.ndarray = None
+        self.profiles = {}
 
     def analyze(self):
         self.read_rtp_stats()
+        self.read_rtcp()
+        self.read_iperf3()
+        if self.received() is not None and self.link is not None:
+            self.add_utilization()
         self.analyze_qlog()
         self.analyze_video_quality()
+        self.read_profiles()
 
     def set_link_capacity(self, link: pd.DataFrame):
         self.link = link
 
+    def set_events(self, events):
+        # ms after basetime at which the scheduler started the flow's client
+        name = 'flow_{}_start'.format(self.config.get('id'))
+        for event in events:
+            if event['name'] == name:
+                self.start = event['actual']
+
+    def input_hash(self, name):
+        if name not in self._input_hashes:
+            self._input_hashes[name] = data_hash(getattr(self, name))
+        return self._input_hashes[name]
+
+    def received(self):
+        # received bytes per packet for RTP, per interval for iperf3
+        if self.incoming_rtp is not None:
+            return self.incoming_rtp
+        return self.iperf3_received
+
+    def summary(self):
+        rates = None
+        received = self.received()
+        if received is not None:
+            rates = window_rate(
+                    to_ms(received.index), received['rate'], self.rate_window)
+        vmaf = None
+        if (self.video_quality_df is not None and
+                'vmaf' in self.video_quality_df.columns):
+            vmaf = self.video_quality_df['vmaf']
+        latency = None if self.latency is None else self.latency['diff']
+
+        return {
+            name: quantiles(data)
+            for name, data in {
+                'latency': latency,
+                'throughput': rates,
+                'vmaf': vmaf,
+            }.items() if data is not None and len(data) > 0
+        }
+
+    def sketches(self):
+        sketches = {}
+        if self.latency is not None and len(self.latency) > 0:
+            latency = self.latency.sort_index()['diff'].to_numpy()
+            sketches['latency'] = DDSketch(unit='s')
+            sketches['latency'].add(latency)
+            sketches['jitter'] = DDSketch(unit='s')
+            sketches['jitter'].add(np.abs(np.diff(latency)))
+
+        for name, qlog in {
+                'rtt_server': self.qlog_server,
+                'rtt_client': self.qlog_client,
+                }.items():
+            if qlog is not None and getattr(qlog, '_rtt_df', None) is not None:
+                if 'latest_rtt' in qlog._rtt_df.columns:
+                    sketches[name] = DDSketch(unit='ms')
+                    sketches[name].add(qlog._rtt_df['latest_rtt'].to_numpy())
+
+        if self.rtcp_received is not None:
+            sketches['rtcp_interval'] = DDSketch(unit='ms')
+            sketches['rtcp_interval'].add(self.rtcp_received.intervals())
+        return sketches
+
+    def target_rate(self):
+        if self.gcc_target_rate is not None:
+            return self.gcc_target_rate['target']
+        if self.scream is not None:
+            return self.scream['target']
+        return None
+
+    def reaction_times(self):
+        # shared by the summary and the RTCP plot
+        target = self.target_rate()
+        if target is None or self.rtcp_received is None:
+            return None
+        if self.reactions is None:
+            self.reactions = self.rtcp_received.reaction_times(target)
+        return self.reactions
+
+    def rtcp_json(self):
+        rtcp = {}
+        if self.rtcp_sent is not None:
+            rtcp['sent'] = self.rtcp_sent.summary(media=self.outgoing_rtp)
+        if self.rtcp_received is not None:
+            rtcp['received'] = self.rtcp_received.summary(
+                    media=self.outgoing_rtp, reactions=self.reaction_times())
+        return rtcp
+
+    def save_sketches(self):
+        Path(self.output_dir).mkdir(parents=True, exist_ok=True)
+        with open(os.path.join(self.output_dir, 'sketches.json'), 'w') as f:
+            json.dump({
+                name: sketch.to_json()
+                for name, sketch in self.sketches().items()
+            }, f)
+
+    def rollup_series(self):
+        columns = {
+            'rtp_sent_bytes': (self.outgoing_rtp, 'rate'),
+            'rtp_received_bytes': (self.incoming_rtp, 'rate'),
+            'rtp_latency': (self.latency, 'diff'),
+            'rtp_lost': (self.lost, None),
+            'iperf3_sent_bytes': (self.iperf3_sent, 'rate'),
+            'iperf3_received_bytes': (self.iperf3_received, 'rate'),
+            'scream_target': (self.scream, 'target'),
+            'scream_queue_delay': (self.scream, 'queueDelay'),
+            'scream_cwnd': (self.scream, 'cwnd'),
+            'gcc_target': (self.gcc_target_rate, 'target'),
+        }
+        series = {}
+        for name, (data, column) in columns.items():
+            if data is None:
+                continue
+            values = data if column is None else data[column]
+            series[name] = (to_ms(data.index), values.to_numpy(dtype=float))
+
+        for name, rtcp in {
+                'rtcp_sent_bytes': self.rtcp_sent,
+                'rtcp_received_bytes': self.rtcp_received,
+                }.items():
+            if rtcp is not None:
+                series[name] = (rtcp.times, rtcp.sizes)
+
+        for side, qlog in {
+                'server': self.qlog_server,
+                'client': self.qlog_client,
+                }.items():
+            if qlog is not None:
+                for name, samples in qlog.series(self.basetime).items():
+                    series[f'qlog_{side}_{name}'] = samples
+        return series
+
+    def save_rollups(self):
+        Path(self.output_dir).mkdir(parents=True, exist_ok=True)
+        save_rollups(
+                os.path.join(self.output_dir, 'rollups.npz'),
+                self.rollup_series())
+
+    def received_packets(self):
+        received = self.received()
+        if received is None:
+            return None
+        return to_ms(received.index), received['rate'].to_numpy()
+
     def read_rtp_stats(self):
         p = Path(self.input_dir)
         files = [file for file in p.glob('**/*') if os.path.isfile(file)]
@@ -70,9 +261,6 @@ class SingleFlowAnalyzer():
             df.index = pd.to_datetime(df.index - self.basetime, unit='ms')
             self.incoming_rtp = df
 
-        if received:
-            self.add_rtp_utilization()
-
         if sent and received:
             self.add_latency(sent, received)
             self.add_loss(sent, received)
@@ -97,12 +285,18 @@ class SingleFlowAnalyzer():
         df_all.index = pd.to_datetime(
                 df_all['time_send'] - self.basetime, unit='ms')
         df_all['lost'] = df_all['_merge'] == 'left_only'
+        self.lost = df_all['lost']
         # print(df_all[df_all['lost'] == True])
-        df_all = df_all.resample('1s').agg(
-                {'time_send': 'count', 'lost': 'sum'})
-        df_all['loss_rate'] = df_all['lost'] / df_all['time_send']
-        df = df_all.drop('time_send', axis=1)
-        self.loss = df.drop('lost', axis=1)
+        times = to_ms(df_all.index)
+        starts, sent = window_sums(
+                times, np.ones(len(times)), self.rate_window)
+        _, lost = window_sums(
+                times, df_all['lost'].to_numpy(dtype=float), self.rate_window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            loss_rate = lost / sent
+        self.loss = pd.DataFrame(
+                {'loss_rate': loss_rate},
+                index=pd.to_datetime(starts, unit='ms'))
 
     def add_latency(self, sent, received):
         df_sent = pd.read_csv(
@@ -124,23 +318,76 @@ class SingleFlowAnalyzer():
         df.index = pd.to_datetime(df['time_send'] - self.basetime, unit='ms')
         df = df.drop(['time_send', 'time_receive'], axis=1)
         self.latency = df
+        self.add_latency_percentiles()
 
-    def add_rtp_utilization(self):
-        rate = self.incoming_rtp.copy()
-        rate['rate'] = rate['rate'].apply(lambda x: x * 8)
-        rate = rate.resample('1s').sum()
-
-        link = self.link.copy()
-        link = link.resample('1s').ffill()
-
-        df = pd.concat(
-            [
-                rate['rate'],
-                link['bandwidth'],
-            ],
-            axis=1,
-            keys=['rate', 'bandwidth'],
-        )
+    def add_latency_percentiles(self):
+        starts, values = rolling_quantiles(
+                to_ms(self.latency.index),
+                self.latency['diff'],
+                self.rate_window,
+                [p / 100 for p in LATENCY_PERCENTILES],
+            )
+        self.latency_percentiles = pd.DataFrame({
+            f'p{p}': v for p, v in zip(LATENCY_PERCENTILES, values)
+        }, index=pd.to_datetime(starts, unit='ms'))
+
+    def latency_percentiles_json(self):
+        if self.latency_percentiles is None:
+            return None
+        df = self.latency_percentiles
+        return {
+            'window': self.rate_window.window,
+            'step': self.rate_window.step,
+            'time': to_ms(df.index).tolist(),
+        } | {
+            column: [None if np.isnan(v) else v for v in df[column].tolist()]
+            for column in df.columns
+        }
+
+    def read_rtcp(self):
+        # feedback as sent by the receiver and as received by the sender
+        for name in FEEDBACK_SENT:
+            p = os.path.join(self.input_dir, name)
+            if os.path.isfile(p):
+                self.rtcp_sent = RTCPAnalyzer(self.rate_window)
+                self.rtcp_sent.read(p, self.basetime)
+
+        for name in FEEDBACK_RECEIVED:
+            p = os.path.join(self.input_dir, name)
+            if os.path.isfile(p):
+                self.rtcp_received = RTCPAnalyzer(self.rate_window)
+                self.rtcp_received.read(p, self.basetime)
+
+    def read_iperf3(self):
+        sent = os.path.join(self.input_dir, 'client.iperf3')
+        if os.path.isfile(sent):
+            iperf3 = Iperf3Analyzer()
+            iperf3.read(sent)
+            self.iperf3_sent = iperf3.frame(self.basetime, self.start)
+
+        received = os.path.join(self.input_dir, 'server.iperf3')
+        if os.path.isfile(received):
+            iperf3 = Iperf3Analyzer()
+            iperf3.read(received)
+            self.iperf3_received = iperf3.frame(self.basetime, self.start)
+
+    def add_utilization(self):
+        received = self.received()
+        rate = window_rate(
+                to_ms(received.index), received['rate'], self.rate_window)
+
+        # capacity at the start of each window
+        index = np.searchsorted(
+                to_ms(self.link.index), to_ms(rate.index), side='right') - 1
+        bandwidth = np.where(
+                index >= 0,
+                self.link['bandwidth'].to_numpy()[np.maximum(index, 0)],
+                np.nan)
+
+        df = pd.DataFrame({
+            'rate': rate.to_numpy(),
+            'bandwidth': bandwidth,
+        }, index=rate.index)
         df['utilization'] = df['rate'] / df['bandwidth']
         self.rtp_utilization = df
 
@@ -150,14 +397,27 @@ class SingleFlowAnalyzer():
 
         sf = next((f for f in files if f.name.endswith('Server.qlog')), None)
         if sf is not None:
-            self.qlog_server = QLOGAnalyzer()
+            self.qlog_server = QLOGAnalyzer(self.rate_window)
             self.qlog_server.read(sf)
 
         cf = next((f for f in files if f.name.endswith('Client.qlog')), None)
         if cf is not None:
-            self.qlog_client = QLOGAnalyzer()
+            self.qlog_client = QLOGAnalyzer(self.rate_window)
             self.qlog_client.read(cf)
 
+    def read_profiles(self):
+        # pprof files are named <sender|receiver>_<kind>.pprof
+        for file in sorted(Path(self.input_dir).glob('*.pprof')):
+            kind = file.stem.split('_')[-1]
+            try:
+                profile = read_profile(file)
+            except (EOFError, IndexError, OSError, ValueError) as e:
+                print('skipping profile {}: {}'.format(file, e))
+                continue
+            top = profile.top(PROFILE_TOP, PROFILE_VALUES.get(kind))
+            if top is not None:
+                self.profiles[file.stem] = top
+
     def analyze_video_quality(self):
         p = os.path.join(self.input_dir, 'video_quality.csv')
         if os.path.isfile(p):
@@ -165,18 +425,10 @@ class SingleFlowAnalyzer():
 
     def plot(self):
         Path(self.output_dir).mkdir(parents=True, exist_ok=True)
-        self.plot_rtp_throughput()
-        self.plot_scream_cwnd()
-        self.plot_scream_delays()
-        self.plot_scream_rates()
-        self.plot_rtp_utilization()
-        self.plot_rtp_departure_arrival()
-        self.plot_rtp_loss()
-        self.plot_rtp_latency()
-        self.plot_rtp_latency_hist()
-        self.plot_qlog()
-        self.plot_video_quality()
+        for name in PLOTS:
+            getattr(self, name)()
 
+    @cached_plot(['scream'])
     def plot_scream_rates(self):
         if self.scream is not None:
             fig, ax = plt.subplots(figsize=(8, 2), dpi=400)
@@ -197,6 +449,7 @@ class SingleFlowAnalyzer():
             fig.savefig(name, bbox_inches='tight')
             plt.close(fig)
 
+    @cached_plot(['scream'])
     def plot_scream_delays(self):
         if self.scream is not None:
             fig, ax = plt.subplots(figsize=(8, 2), dpi=400)
@@ -214,6 +467,7 @@ class SingleFlowAnalyzer():
             fig.savefig(name, bbox_inches='tight')
             plt.close(fig)
 
+    @cached_plot(['scream'])
     def plot_scream_cwnd(self):
         if self.scream is not None:
             fig, ax = plt.subplots(figsize=(8, 2), dpi=400)
@@ -234,19 +488,26 @@ class SingleFlowAnalyzer():
             fig.savefig(name, bbox_inches='tight')
             plt.close(fig)
 
+    @cached_plot(
+            ['link', 'outgoing_rtp', 'incoming_rtp', 'scream',
+             'gcc_target_rate', 'rate_window'],
+            ['plot_link_capacity'])
     def plot_rtp_throughput(self):
+        if self.outgoing_rtp is None or self.incoming_rtp is None:
+            return
         fig, ax = plt.subplots(figsize=(8, 2), dpi=400)
         labels = []
 
         labels.append(self.plot_link_capacity(ax))
 
-        outgoing_rtp = self.outgoing_rtp[['rate']].copy()
-        outgoing_rtp['rate'] = outgoing_rtp['rate'].apply(lambda x: x * 8)
-        outgoing_rtp = outgoing_rtp.resample('1s').sum()
-
-        incoming_rtp = self.incoming_rtp[['rate']].copy()
-        incoming_rtp['rate'] = incoming_rtp['rate'].apply(lambda x: x * 8)
-        incoming_rtp = incoming_rtp.resample('1s').sum()
+        outgoing_rtp = window_rate(
+                to_ms(self.outgoing_rtp.index),
+                self.outgoing_rtp['rate'],
+                self.rate_window)
+        incoming_rtp = window_rate(
+                to_ms(self.incoming_rtp.index),
+                self.incoming_rtp['rate'],
+                self.rate_window)
 
         target_rate = None
         if self.scream is not None:
@@ -278,7 +539,39 @@ class SingleFlowAnalyzer():
         fig.savefig(name, bbox_inches='tight')
         plt.close(fig)
 
+    @cached_plot(
+            ['link', 'iperf3_sent', 'iperf3_received', 'rate_window'],
+            ['plot_link_capacity'])
+    def plot_iperf3_throughput(self):
+        if self.iperf3_sent is None and self.iperf3_received is None:
+            return
+        fig, ax = plt.subplots(figsize=(8, 2), dpi=400)
+        labels = [self.plot_link_capacity(ax)]
+        for label, data in {
+                'Sent': self.iperf3_sent,
+                'Received': self.iperf3_received,
+                }.items():
+            if data is not None:
+                rate = window_rate(
+                        to_ms(data.index), data['rate'], self.rate_window)
+                out, = ax.plot(rate, linewidth=0.5, label=label)
+                labels.append(out)
+
+        ax.set_xlabel('Time')
+        ax.set_ylabel('Rate')
+        ax.set_title('iperf3 Throughput')
+        ax.xaxis.set_major_formatter(DateFormatter("%M:%S"))
+        ax.yaxis.set_major_formatter(EngFormatter(unit='bit/s'))
+        ax.legend(handles=labels)
+        name = os.path.join(self.output_dir, 'iperf3_throughput.png')
+        self.plot_files.append(name)
+        fig.savefig(name, bbox_inches='tight')
+        plt.close(fig)
+
+    @cached_plot(['rtp_utilization'])
     def plot_rtp_utilization(self):
+        if self.rtp_utilization is None:
+            return
         fig, ax = plt.subplots(figsize=(8, 2), dpi=400)
         defaults = {
             'linewidth': 0.5,
@@ -292,7 +585,10 @@ class SingleFlowAnalyzer():
         fig.savefig(name, bbox_inches='tight')
         plt.close(fig)
 
+    @cached_plot(['outgoing_rtp', 'incoming_rtp'])
     def plot_rtp_departure_arrival(self):
+        if self.outgoing_rtp is None or self.incoming_rtp is None:
+            return
         fig, ax = plt.subplots(dpi=400)
         labels = []
 
@@ -327,7 +623,10 @@ class SingleFlowAnalyzer():
         fig.savefig(name, bbox_inches='tight')
         plt.close(fig)
 
+    @cached_plot(['latency'])
     def plot_rtp_latency_hist(self):
+        if self.latency is None:
+            return
         fig, ax = plt.subplots(figsize=(8, 2), dpi=400)
         ax.hist(
                 self.latency['diff'],
@@ -340,7 +639,10 @@ class SingleFlowAnalyzer():
         fig.savefig(name, bbox_inches='tight')
         plt.close(fig)
 
+    @cached_plot(['latency'])
     def plot_rtp_latency(self):
+        if self.latency is None:
+            return
         fig, ax = plt.subplots(figsize=(8, 2), dpi=400)
         defaults = {
            's': 0.1,
@@ -356,7 +658,36 @@ class SingleFlowAnalyzer():
         fig.savefig(name, bbox_inches='tight')
         plt.close(fig)
 
+    @cached_plot(['latency_percentiles'])
+    def plot_rtp_latency_percentiles(self):
+        if self.latency_percentiles is None:
+            return
+        df = self.latency_percentiles
+        fig, ax = plt.subplots(figsize=(8, 2), dpi=400)
+        ax.fill_between(
+                df.index, df['p50'], df['p99'], step='post', alpha=0.2,
+                linewidth=0, label='p50-p99')
+        ax.fill_between(
+                df.index, df['p50'], df['p95'], step='post', alpha=0.4,
+                linewidth=0, label='p50-p95')
+        ax.step(df.index, df['p50'], where='post', linewidth=0.5,
+                label='p50')
+        ax.set_title('RTP Packet Latency Percentiles ({} ms window)'.format(
+            self.rate_window.window))
+        ax.set_ylabel('Latency')
+        ax.set_xlabel('Time')
+        ax.xaxis.set_major_formatter(DateFormatter("%M:%S"))
+        ax.yaxis.set_major_formatter(EngFormatter(unit='s'))
+        ax.legend()
+        name = os.path.join(self.output_dir, 'rtp_latency_percentiles.png')
+        self.plot_files.append(name)
+        fig.savefig(name, bbox_inches='tight')
+        plt.close(fig)
+
+    @cached_plot(['loss'])
     def plot_rtp_loss(self):
+        if self.loss is None:
+            return
         fig, ax = plt.subplots(figsize=(8, 2), dpi=400)
         defaults = {
             'linewidth': 0.5,
@@ -372,6 +703,56 @@ class SingleFlowAnalyzer():
         fig.savefig(name, bbox_inches='tight')
         plt.close(fig)
 
+    @cached_plot(
+            ['rtcp_sent', 'rtcp_received', 'outgoing_rtp', 'scream',
+             'gcc_target_rate', 'rate_window'],
+            ['target_rate', 'reaction_times', 'RTCPAnalyzer'])
+    def plot_rtcp_feedback(self):
+        rtcp = self.rtcp_received or self.rtcp_sent
+        if rtcp is None or len(rtcp.times) < 2:
+            return
+        fig, (ax_rate, ax_overhead, ax_cdf) = plt.subplots(
+                ncols=3, figsize=(15, 3), dpi=400)
+
+        for label, analyzer in {
+                'Sent': self.rtcp_sent,
+                'Received': self.rtcp_received,
+                }.items():
+            if analyzer is not None:
+                ax_rate.plot(
+                        analyzer.feedback_rate(), linewidth=0.5, label=label)
+        ax_rate.set_title('RTCP Feedback Rate')
+        ax_rate.set_ylabel('Reports/s')
+        ax_rate.xaxis.set_major_formatter(DateFormatter("%M:%S"))
+        ax_rate.legend()
+
+        if self.outgoing_rtp is not None:
+            ax_overhead.plot(
+                    rtcp.overhead(self.outgoing_rtp), linewidth=0.5)
+        ax_overhead.set_title('RTCP Overhead')
+        ax_overhead.xaxis.set_major_formatter(DateFormatter("%M:%S"))
+        ax_overhead.yaxis.set_major_formatter(PercentFormatter(xmax=1.0))
+
+        samples = {'Report Interval': rtcp.intervals()}
+        reactions = self.reaction_times()
+        if reactions is not None:
+            samples['Reaction Time'] = reactions
+        for label, values in samples.items():
+            if len(values) > 0:
+                values = np.sort(values) / 1000
+                ax_cdf.plot(
+                        values, np.arange(1, len(values) + 1) / len(values),
+                        linewidth=0.8, label=label)
+        ax_cdf.set_title('RTCP Timing CDF')
+        ax_cdf.xaxis.set_major_formatter(EngFormatter(unit='s'))
+        ax_cdf.legend()
+
+        fig.tight_layout()
+        name = os.path.join(self.output_dir, 'rtcp_feedback.png')
+        self.plot_files.append(name)
+        fig.savefig(name, bbox_inches='tight')
+        plt.close(fig)
+
     def plot_qlog_rates(self, qlog_plot_func, title, filename):
         labels = []
         fig, ax = plt.subplots(figsize=(8, 2), dpi=400)
@@ -404,6 +785,9 @@ class SingleFlowAnalyzer():
                 **p)
         return out
 
+    @cached_plot(
+            ['link', 'qlog_server', 'qlog_client'],
+            ['plot_qlog_rates', 'plot_link_capacity', 'QLOGAnalyzer'])
     def plot_qlog(self):
         if self.qlog_server:
             self.plot_qlog_rates(
@@ -445,6 +829,7 @@ class SingleFlowAnalyzer():
                 fig.savefig(name, bbox_inches='tight')
                 plt.close(fig)
 
+    @cached_plot(['video_quality_df'], ['plot_video_metric'])
     def plot_video_quality(self):
         if self.video_quality_df is not None:
             fig, (
@@ -452,9 +837,13 @@ class SingleFlowAnalyzer():
                     (psnr_h, ssim_h, vmaf_h),
                 ) = plt.subplots(nrows=2, ncols=3, figsize=(20, 10), dpi=400)
 
-            self.plot_video_metric('ssim', ssim, ssim_h)
-            self.plot_video_metric('psnr', psnr, psnr_h)
-            self.plot_video_metric('vmaf', vmaf, vmaf_h)
+            for metric, ax, ax_h in [
+                    ('ssim', ssim, ssim_h),
+                    ('psnr', psnr, psnr_h),
+                    ('vmaf', vmaf, vmaf_h),
+                    ]:
+                if metric in self.video_quality_df.columns:
+                    self.plot_video_metric(metric, ax, ax_h)
 
             psnr.set_title('PSNR')
             psnr_h.set_title('PSNR Histogram')
@@ -494,6 +883,14 @@ class SingleFlowAnalyzer():
                   verticalalignment='top', bbox=props)
 
 
+def quantiles(series, n=101):
+    values = series.to_numpy(dtype=float)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return []
+    return np.quantile(values, np.linspace(0, 1, n)).tolist()
+
+
 def read_rtp(file):
     return pd.read_csv(
         file,
@@ -538,6 +935,6 @@ def read_gcc_target_rate(file):
 def read_video_quality(file):
     return pd.read_csv(
         file,
-        index_col=0,
-        usecols=[0, 12, 13, 14],
+        index_col='Frame',
+        usecols=lambda c: c in ['Frame', 'psnr', 'ssim', 'vmaf'],
     )
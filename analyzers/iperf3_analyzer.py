@@ -0,0 +1,93 @@
+import json
+import re
+
+import numpy as np
+import pandas as pd
+
+CHUNK_SIZE = 1 << 20
+# ms between the samples an interval's bytes are spread over
+SPREAD_STEP = 10
+INTERVALS = re.compile(r'"intervals"\s*:\s*\[')
+TIMESECS = re.compile(r'"timesecs"\s*:\s*(\d+)')
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+class Iperf3Analyzer():
+    def __init__(self):
+        self.timestamp = None
+        self.starts = []
+        self.ends = []
+        self.bytes = []
+
+    def add_interval(self, interval):
+        total = interval.get('sum')
+        if total is None or total.get('omitted', False):
+            return
+        self.starts.append(total['start'])
+        self.ends.append(total['end'])
+        self.bytes.append(total['bytes'])
+
+    def read(self, file):
+        # Stream-parses the intervals array of an iperf3 --json log. The
+        # document is read in chunks and every interval is decoded as soon as
+        # the buffer holds it completely, so memory does not grow with the
+        # length of the run. Logs cut off by killing iperf3 end after the last
+        # complete interval.
+        decoder = json.JSONDecoder()
+        buffer = ''
+        pos = None
+        eof = False
+        with open(file) as f:
+            while True:
+                if pos is None:
+                    match = INTERVALS.search(buffer)
+                    if match is not None:
+                        timesecs = TIMESECS.search(buffer, 0, match.start())
+                        if timesecs is not None:
+                            self.timestamp = int(timesecs.group(1)) * 1000
+                        pos = match.end()
+                        continue
+                else:
+                    pos = SEPARATORS.match(buffer, pos).end()
+                    if buffer.startswith(']', pos):
+                        break
+                    try:
+                        interval, pos = decoder.raw_decode(buffer, pos)
+                        self.add_interval(interval)
+                        continue
+                    except json.JSONDecodeError:
+                        pass
+
+                if eof:
+                    break
+                chunk = f.read(CHUNK_SIZE)
+                eof = chunk == ''
+                if pos is not None:
+                    buffer, pos = buffer[pos:], 0
+                buffer += chunk
+
+    def frame(self, basetime, start=None):
+        # Bytes like read_rtp's rate, every interval's bytes spread evenly
+        # over [start, end) so that windows shorter than the iperf3 interval
+        # see a steady rate. start is the ms after basetime at which the flow
+        # was started, the iperf3 timestamp only has second resolution and
+        # is a fallback.
+        offset = 0
+        if start is not None:
+            offset = start
+        elif self.timestamp is not None and basetime is not None:
+            offset = self.timestamp - basetime
+        starts = np.asarray(self.starts, dtype=float) * 1000
+        ends = np.asarray(self.ends, dtype=float) * 1000
+        steps = np.maximum(
+                1, np.round((ends - starts) / SPREAD_STEP)).astype(np.int64)
+        index = np.repeat(np.arange(len(steps)), steps)
+        # position of every sample within its interval
+        k = np.arange(len(index)) - np.repeat(np.cumsum(steps) - steps, steps)
+        times = offset + starts[index] + \
+            k * (ends - starts)[index] / steps[index]
+        sizes = np.asarray(self.bytes, dtype=float)[index] / steps[index]
+        return pd.DataFrame(
+                {'rate': sizes},
+                index=pd.to_datetime(times, unit='ms'),
+            )
@@ -0,0 +1,273 @@
+import glob
+import json
+import os
+import time
+
+from collections import Counter, defaultdict
+from threading import Event, Thread
+
+import numpy as np
+
+from analyzers.windows import RateWindow, window_sums
+
+RTP_FLOWS = ['rtp-over-quic-go', 'bwe-test-pion-abr']
+
+
+class TailReader():
+    def __init__(self, path):
+        self._path = path
+        self._file = None
+        self._buffer = ''
+
+    def lines(self):
+        if self._file is None:
+            if not os.path.isfile(self._path):
+                return []
+            self._file = open(self._path)
+        data = self._file.read()
+        if not data:
+            return []
+        lines = (self._buffer + data).split('\n')
+        self._buffer = lines.pop()
+        return [line for line in lines if line]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def percentiles(histogram, ps=(50, 95, 99)):
+    count = sum(histogram.values())
+    result = {}
+    if count == 0:
+        return result
+    values = sorted(histogram.items())
+    for p in ps:
+        rank = p / 100 * (count - 1)
+        seen = 0
+        for value, n in values:
+            seen += n
+            if seen > rank:
+                result[f'p{p}'] = value
+                break
+    return result
+
+
+class LiveFlowAnalyzer():
+    def __init__(self, flow, basetime, loss_timeout=1000):
+        self.id = flow.id
+        self.delay = flow.delay
+        self._basetime = basetime
+        self._loss_timeout = loss_timeout
+        self._log_dir = flow.log_dir
+        self._sender = TailReader(os.path.join(self._log_dir, 'sender.rtp'))
+        self._receiver = TailReader(
+                os.path.join(self._log_dir, 'receiver.rtp'))
+        self._qlogs = {}
+
+        self.sent_bytes = defaultdict(int)
+        self.received_bytes = defaultdict(int)
+        self.latency = Counter()
+        self.rtt = Counter()
+        self.sent = 0
+        self.lost = 0
+        self.late = 0
+        self.qlog_lost = 0
+        self.last_receive = None
+        self._pending = {}
+        self._early = {}
+        # sent times of packets counted as lost, in case they still arrive
+        self._expired = {}
+
+    def ms(self, t):
+        return t - self._basetime
+
+    def poll(self):
+        for line in self._sender.lines():
+            fields = line.split(',')
+            t, size, nr = int(fields[0]), int(fields[6]), int(fields[8])
+            self.sent += 1
+            self.sent_bytes[self.ms(t)] += size
+            if nr in self._early:
+                self.latency[self._early.pop(nr) - t] += 1
+            else:
+                self._pending[nr] = t
+
+        for line in self._receiver.lines():
+            fields = line.split(',')
+            t, size, nr = int(fields[0]), int(fields[6]), int(fields[8])
+            self.received_bytes[self.ms(t)] += size
+            self.last_receive = t
+            if nr in self._pending:
+                self.latency[t - self._pending.pop(nr)] += 1
+            elif nr in self._expired:
+                # arrived after the loss timeout, late rather than lost
+                self.latency[t - self._expired.pop(nr)] += 1
+                self.lost -= 1
+                self.late += 1
+            else:
+                self._early[nr] = t
+
+        for f in glob.glob(os.path.join(self._log_dir, '*.qlog')):
+            if f not in self._qlogs:
+                self._qlogs[f] = TailReader(f)
+        for reader in self._qlogs.values():
+            for line in reader.lines():
+                self.add_qlog_event(json.loads(line.strip()))
+
+        self.expire_pending(self.last_receive)
+
+    def add_qlog_event(self, event):
+        name = event.get('name')
+        if name == 'recovery:packet_lost':
+            self.qlog_lost += 1
+        elif name == 'recovery:metrics_updated':
+            rtt = event.get('data', {}).get('latest_rtt')
+            if rtt is not None:
+                self.rtt[round(rtt)] += 1
+
+    def expire_pending(self, now):
+        if now is None:
+            return
+        expired = [nr for nr, t in self._pending.items()
+                   if now - t > self._loss_timeout]
+        for nr in expired:
+            self._expired[nr] = self._pending.pop(nr)
+        self.lost += len(expired)
+
+    def finish(self):
+        self.poll()
+        self.lost += len(self._pending)
+        self._pending = {}
+        self._sender.close()
+        self._receiver.close()
+        for reader in self._qlogs.values():
+            reader.close()
+
+    def received_since(self, ms):
+        return sum(v for k, v in self.received_bytes.items() if k >= ms)
+
+    def received_rates(self, rate_window, end):
+        # bit/s per window, the windows start at basetime
+        _, sums = window_sums(
+                list(self.received_bytes.keys()),
+                list(self.received_bytes.values()),
+                rate_window, 0, end)
+        return sums * 8 * 1000 / rate_window.window
+
+    def kpis(self, rates, capacity):
+        return {
+            'sent_packets': self.sent,
+            'lost_packets': self.lost,
+            'late_packets': self.late,
+            'loss': self.lost / self.sent if self.sent > 0 else 0,
+            'rate': float(rates.mean()) if len(rates) > 0 else 0,
+            'utilization': float(rates.sum() / capacity.sum())
+            if capacity.sum() else 0,
+            'latency': percentiles(self.latency),
+            'rtt': percentiles(self.rtt),
+            'qlog_packets_lost': self.qlog_lost,
+        }
+
+
+class LiveAnalyzer():
+    def __init__(self, log_dir, flows, basetime, abort_after=0, interval=1,
+                 rate_window=RateWindow()):
+        self._log_dir = log_dir
+        self._rate_window = rate_window
+        self._basetime = basetime
+        self._abort_after = abort_after
+        self._interval = interval
+        self._link = TailReader(os.path.join(log_dir, 'link.log'))
+        self._capacity = []
+        self._flows = [LiveFlowAnalyzer(f, basetime)
+                       for f in flows
+                       if f.config_json().get('name') in RTP_FLOWS]
+        self._stop = Event()
+        self._thread = None
+        self.abort_reason = None
+
+    def start(self, on_abort):
+        self._thread = Thread(target=self.run, args=(on_abort, ))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def run(self, on_abort):
+        while not self._stop.wait(self._interval):
+            self.poll()
+            reason = self.check()
+            if reason is not None:
+                self.abort_reason = reason
+                on_abort()
+                return
+
+    def poll(self):
+        for line in self._link.lines():
+            fields = line.split(',')
+            self._capacity.append((int(fields[0]), int(fields[2])))
+        for f in self._flows:
+            f.poll()
+
+    def check(self):
+        if self._abort_after <= 0:
+            return None
+        elapsed = self.elapsed_seconds()
+        for f in self._flows:
+            window_start = elapsed - self._abort_after
+            if window_start < f.delay:
+                continue
+            if f.received_since(window_start * 1000) == 0:
+                return 'flow {} received nothing for {}s'.format(
+                        f.id, self._abort_after)
+        return None
+
+    def elapsed_seconds(self):
+        return (int(time.time() * 1000) - self._basetime) // 1000
+
+    def capacity_per_window(self, end):
+        # capacity at the start of every rate window until end ms after
+        # basetime
+        starts = np.arange(0, end + 1, self._rate_window.step)
+        if len(self._capacity) == 0:
+            return np.zeros(len(starts))
+        times = np.array([t for t, _ in self._capacity]) - self._basetime
+        rates = np.array([c for _, c in self._capacity], dtype=float)
+        index = np.searchsorted(times, starts, side='right') - 1
+        return rates[np.maximum(index, 0)]
+
+    def stop(self, end_time):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.poll()
+        for f in self._flows:
+            f.finish()
+
+        end = max(0, end_time - self._basetime)
+        capacity = self.capacity_per_window(end)
+        rates = {f.id: f.received_rates(self._rate_window, end)
+                 for f in self._flows}
+        flows = {str(f.id): f.kpis(rates[f.id], capacity)
+                 for f in self._flows}
+        latency = Counter()
+        sent = lost = 0
+        received = 0.0
+        for f in self._flows:
+            latency.update(f.latency)
+            sent += f.sent
+            lost += f.lost
+            received += rates[f.id].sum()
+        total = {
+            'utilization': float(received / capacity.sum())
+            if capacity.sum() else 0,
+            'latency_p95': percentiles(latency, (95, )).get('p95'),
+            'loss': lost / sent if sent > 0 else 0,
+        }
+        kpis = {
+            'kpis': total,
+            'flows': flows,
+            'aborted': self.abort_reason,
+        }
+        with open(os.path.join(self._log_dir, 'kpis.json'), 'w') as file:
+            json.dump(kpis, file)
+        return kpis
@@ -0,0 +1,164 @@
+import functools
+import hashlib
+import inspect
+import os
+import shutil
+import tempfile
+
+from pathlib import Path
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+
+class PlotCache():
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Estimate of the cache size, updated by this process's puts and
+        # recomputed by every eviction scan. Other workers' puts are only
+        # seen by the next scan.
+        self._size = None
+        Path(directory).mkdir(parents=True, exist_ok=True)
+
+    def get(self, key, output_dir):
+        entry = os.path.join(self.directory, key)
+        if not os.path.isdir(entry):
+            return None
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        files = []
+        try:
+            for name in sorted(os.listdir(entry)):
+                # strip the prefix that keeps the original order of the files
+                dst = os.path.join(output_dir, name.split('-', 1)[1])
+                shutil.copyfile(os.path.join(entry, name), dst)
+                files.append(dst)
+        except OSError:
+            # evicted by another worker while copying
+            return None
+        # the entry's mtime is the LRU timestamp used for eviction
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return files
+
+    def put(self, key, files):
+        entry = os.path.join(self.directory, key)
+        if os.path.isdir(entry):
+            return
+        tmp = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        size = 0
+        for i, f in enumerate(files):
+            shutil.copyfile(f, os.path.join(
+                tmp, '{:03d}-{}'.format(i, os.path.basename(f))))
+            size += os.path.getsize(f)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # another worker stored the same plot concurrently
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        if self._size is None or self._size + size > self.max_bytes:
+            self.evict()
+        else:
+            self._size += size
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            if name.startswith('.'):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(entry))
+                mtime = os.stat(entry).st_mtime
+            except OSError:
+                # removed by another worker, or not an entry
+                continue
+            entries.append((mtime, size, entry))
+            total += size
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+        self._size = total
+
+
+_sources = {}
+
+
+def source_hash(obj):
+    if obj not in _sources:
+        _sources[obj] = hashlib.sha256(
+                inspect.getsource(obj).encode('utf-8')).hexdigest()
+    return _sources[obj]
+
+
+def data_hash(data):
+    # Fails on attribute types it can not hash, a plot cached by a key that
+    # does not cover all of its data could serve another run's figure.
+    if data is None:
+        return 'none'
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        h = hashlib.sha256(
+                pd.util.hash_pandas_object(data, index=True).to_numpy())
+        columns = data.columns if isinstance(data, pd.DataFrame) \
+            else [data.name]
+        h.update(','.join(str(c) for c in columns).encode('utf-8'))
+        return h.hexdigest()
+    if isinstance(data, np.ndarray):
+        h = hashlib.sha256(str(data.dtype).encode('utf-8'))
+        h.update(repr(data.shape).encode('utf-8'))
+        h.update(np.ascontiguousarray(data).tobytes())
+        return h.hexdigest()
+    if isinstance(data, (bool, int, float, str, tuple, list, dict)):
+        # plain values, named tuples like RateWindow and the lists of qlog
+        # events
+        return hashlib.sha256(repr(data).encode('utf-8')).hexdigest()
+    if hasattr(data, '__dict__'):
+        h = hashlib.sha256(type(data).__name__.encode('utf-8'))
+        for name, value in sorted(vars(data).items()):
+            h.update(name.encode('utf-8'))
+            h.update(data_hash(value).encode('utf-8'))
+        return h.hexdigest()
+    raise TypeError('can not hash plot input of type {}'.format(
+        type(data).__name__))
+
+
+def cached_plot(inputs, helpers=()):
+    # Caches the files a plot method appends to self.plot_files. The key
+    # covers the plot's input data, the source of the method and its helpers
+    # (and thereby all style parameters set in code) and the matplotlib
+    # version.
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args):
+            cache = getattr(self, 'plot_cache', None)
+            if cache is None:
+                return func(self, *args)
+
+            h = hashlib.sha256(matplotlib.__version__.encode('utf-8'))
+            h.update(func.__qualname__.encode('utf-8'))
+            h.update(source_hash(func).encode('utf-8'))
+            for helper in helpers:
+                resolved = getattr(type(self), helper, None) or \
+                    func.__globals__[helper]
+                h.update(source_hash(resolved).encode('utf-8'))
+            for name in inputs:
+                h.update(self.input_hash(name).encode('utf-8'))
+            h.update(repr(args).encode('utf-8'))
+            key = h.hexdigest()
+
+            files = cache.get(key, self.output_dir)
+            if files is not None:
+                self.plot_files.extend(files)
+                return
+            before = len(self.plot_files)
+            func(self, *args)
+            cache.put(key, self.plot_files[before:])
+        return wrapper
+    return decorator
@@ -0,0 +1,203 @@
+import gzip
+
+# value to rank functions by for the profiles written by RTPoverQUIC
+PROFILE_VALUES = {
+    'cpu': 'cpu',
+    'heap': 'inuse_space',
+    'allocs': 'alloc_space',
+    'block': 'delay',
+    'mutex': 'delay',
+    'goroutine': 'goroutine',
+}
+
+
+def read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def signed(value):
+    # int64 fields are encoded as two's complement varints
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def read_fields(data):
+    # Yields (field number, wire type, value) of a protobuf message. Values
+    # of length delimited fields are memoryviews into data.
+    pos = 0
+    end = len(data)
+    while pos < end:
+        key, pos = read_varint(data, pos)
+        field, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 1:
+            value = int.from_bytes(data[pos:pos + 8], 'little')
+            pos += 8
+        elif wire_type == 2:
+            length, pos = read_varint(data, pos)
+            value = data[pos:pos + length]
+            pos += length
+        elif wire_type == 5:
+            value = int.from_bytes(data[pos:pos + 4], 'little')
+            pos += 4
+        else:
+            raise ValueError('unsupported wire type {}'.format(wire_type))
+        yield field, wire_type, value
+
+
+def read_repeated(wire_type, value):
+    # repeated scalars are either packed into one field or sent one by one
+    if wire_type != 2:
+        return [value]
+    values = []
+    pos = 0
+    while pos < len(value):
+        v, pos = read_varint(value, pos)
+        values.append(v)
+    return values
+
+
+class Profile():
+    # Decoder for the perftools.profiles.Profile protobuf written by Go's
+    # runtime/pprof, see github.com/google/pprof/blob/main/proto/profile.proto
+
+    def __init__(self):
+        self.sample_types = []
+        self.samples = []
+        self.locations = {}
+        self.functions = {}
+        self.strings = []
+        self.duration_nanos = 0
+        self.default_sample_type = 0
+
+    def parse(self, data):
+        data = memoryview(data)
+        sample_types = []
+        functions = {}
+        for field, wire_type, value in read_fields(data):
+            if field == 1:
+                sample_types.append(self.parse_value_type(value))
+            elif field == 2:
+                self.samples.append(self.parse_sample(value))
+            elif field == 4:
+                id, function_ids = self.parse_location(value)
+                self.locations[id] = function_ids
+            elif field == 5:
+                id, name = self.parse_function(value)
+                functions[id] = name
+            elif field == 6:
+                self.strings.append(str(value, 'utf-8', 'replace'))
+            elif field == 10:
+                self.duration_nanos = signed(value)
+            elif field == 14:
+                self.default_sample_type = signed(value)
+
+        # names are indices into the string table, which may come last
+        self.sample_types = [
+            (self.strings[t], self.strings[u]) for t, u in sample_types]
+        self.functions = {
+            id: self.strings[name] for id, name in functions.items()}
+
+    def parse_value_type(self, data):
+        type, unit = 0, 0
+        for field, _, value in read_fields(data):
+            if field == 1:
+                type = value
+            elif field == 2:
+                unit = value
+        return type, unit
+
+    def parse_sample(self, data):
+        location_ids = []
+        values = []
+        for field, wire_type, value in read_fields(data):
+            if field == 1:
+                location_ids.extend(read_repeated(wire_type, value))
+            elif field == 2:
+                values.extend(
+                        signed(v) for v in read_repeated(wire_type, value))
+        return location_ids, values
+
+    def parse_location(self, data):
+        id = 0
+        function_ids = []
+        for field, _, value in read_fields(data):
+            if field == 1:
+                id = value
+            elif field == 4:
+                for line_field, _, line_value in read_fields(value):
+                    if line_field == 1:
+                        function_ids.append(line_value)
+        return id, function_ids
+
+    def parse_function(self, data):
+        id, name = 0, 0
+        for field, _, value in read_fields(data):
+            if field == 1:
+                id = value
+            elif field == 2:
+                name = value
+        return id, name
+
+    def value_index(self, sample_type=None):
+        types = [t for t, _ in self.sample_types]
+        if sample_type in types:
+            return types.index(sample_type)
+        if self.default_sample_type:
+            default = self.strings[self.default_sample_type]
+            if default in types:
+                return types.index(default)
+        return len(types) - 1
+
+    def top(self, n=10, sample_type=None):
+        # Functions ranked by their own (flat) value. The cumulative value
+        # counts every function once per sample it appears in.
+        if len(self.sample_types) == 0:
+            return None
+        index = self.value_index(sample_type)
+        flat = {}
+        cum = {}
+        total = 0
+        for location_ids, values in self.samples:
+            value = values[index]
+            total += value
+            # the first line of the first location is the innermost frame
+            stack = [f for id in location_ids
+                     for f in self.locations.get(id, [])]
+            if len(stack) == 0:
+                continue
+            flat[stack[0]] = flat.get(stack[0], 0) + value
+            for function_id in set(stack):
+                cum[function_id] = cum.get(function_id, 0) + value
+
+        ranked = sorted(flat, key=flat.get, reverse=True)[:n]
+        type, unit = self.sample_types[index]
+        return {
+            'sample_type': type,
+            'unit': unit,
+            'total': total,
+            'duration_s': self.duration_nanos / 1e9,
+            'top': [{
+                'function': self.functions.get(id, str(id)),
+                'flat': flat[id],
+                'cum': cum[id],
+            } for id in ranked],
+        }
+
+
+def read_profile(file):
+    with open(file, 'rb') as f:
+        data = f.read()
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+    profile = Profile()
+    profile.parse(data)
+    return profile
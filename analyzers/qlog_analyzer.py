@@ -2,12 +2,15 @@ import json
 
 import pandas as pd
 
+from analyzers.windows import RateWindow, window_rate
+
 from matplotlib.dates import DateFormatter
 from matplotlib.ticker import EngFormatter
 
 
 class QLOGAnalyzer():
-    def __init__(self):
+    def __init__(self, rate_window=RateWindow()):
+        self.rate_window = rate_window
         self.inflight = []
         self.congestion = []
         self.dgram_tx = []
@@ -18,6 +21,7 @@ class QLOGAnalyzer():
         self.sums_rx = []
         self.rtt = []
         self.packet_loss = []
+        self.reference_time = None
 
     def add_bytes_inflight(self, event):
         if (
@@ -133,6 +137,16 @@ class QLOGAnalyzer():
                     'bytes': s,
                 })
 
+    def add_reference_time(self, event):
+        # The header of a JSON-SEQ qlog holds the unix time in ms that the
+        # event times are relative to.
+        trace = event.get('trace')
+        if trace is None:
+            return
+        reference_time = trace.get('common_fields', {}).get('reference_time')
+        if reference_time is not None:
+            self.reference_time = float(reference_time)
+
     def add_loss(self, event):
         if (
                 'name' in event and
@@ -148,6 +162,7 @@ class QLOGAnalyzer():
         with open(file) as f:
             for index, line in enumerate(f):
                 event = json.loads(line.strip())
+                self.add_reference_time(event)
                 self.add_bytes_inflight(event)
                 self.add_cwnd(event)
                 self.add_rtt(event)
@@ -166,6 +181,46 @@ class QLOGAnalyzer():
         self.set_rate_tx(self.sums_tx)
         self.set_packet_loss(self.packet_loss)
 
+    def series(self, basetime):
+        # Raw samples as (ms after basetime, values) for rollups, on the same
+        # time base as the RTP logs. Empty if the qlog has no reference time.
+        series = {}
+        if self.reference_time is None or basetime is None:
+            return series
+        offset = self.reference_time - basetime
+        for name, samples, key in [
+                ('bytes_in_flight', self.inflight, 'bytes_in_flight'),
+                ('cwnd', self.congestion, 'cwnd'),
+                ('latest_rtt', self.rtt, 'latest_rtt'),
+                ('smoothed_rtt', self.rtt, 'smoothed_rtt'),
+                ('tx_bytes', self.sums_tx, 'bytes'),
+                ('rx_bytes', self.sums_rx, 'bytes'),
+                ('tx_dgram_bytes', self.dgram_tx, 'bytes'),
+                ('rx_dgram_bytes', self.dgram_rx, 'bytes'),
+                ('tx_stream_bytes', self.stream_tx, 'bytes'),
+                ('rx_stream_bytes', self.stream_rx, 'bytes'),
+                ]:
+            samples = [s for s in samples if key in s]
+            if len(samples) > 0:
+                series[name] = (
+                    [round(s['time'] + offset) for s in samples],
+                    [s[key] for s in samples],
+                )
+        if len(self.packet_loss) > 0:
+            series['packets_lost'] = (
+                [round(s['time'] + offset) for s in self.packet_loss],
+                [1] * len(self.packet_loss),
+            )
+        return series
+
+    def rate_df(self, samples):
+        # bit/s in the 'bytes' column, as used by the rate plots
+        rate = window_rate(
+                [s['time'] for s in samples],
+                [s['bytes'] for s in samples],
+                self.rate_window)
+        return pd.DataFrame({'bytes': rate.to_numpy()}, index=rate.index)
+
     def set_inflight(self, inflight):
         self._df_inflight = pd.DataFrame(inflight)
         self._df_inflight.index = pd.to_datetime(
@@ -185,57 +240,27 @@ class QLOGAnalyzer():
 
     def set_dgram_rx(self, dgram):
         if len(dgram) > 0:
-            self._dgram_rx_df = pd.DataFrame(dgram)
-            self._dgram_rx_df.index = pd.to_datetime(
-                    self._dgram_rx_df['time'], unit='ms')
-            self._dgram_rx_df['bytes'] = self._dgram_rx_df['bytes'].apply(
-                    lambda x: x * 8)
-            self._dgram_rx_df = self._dgram_rx_df.resample('1s').sum()
+            self._dgram_rx_df = self.rate_df(dgram)
 
     def set_stream_rx(self, stream):
         if len(stream) > 0:
-            self._stream_rx_df = pd.DataFrame(stream)
-            self._stream_rx_df.index = pd.to_datetime(
-                    self._stream_rx_df['time'], unit='ms')
-            self._stream_rx_df['bytes'] = self._stream_rx_df['bytes'].apply(
-                    lambda x: x * 8)
-            self._stream_rx_df = self._stream_rx_df.resample('1s').sum()
+            self._stream_rx_df = self.rate_df(stream)
 
     def set_rate_rx(self, rate):
         if len(rate) > 0:
-            self._rate_rx_df = pd.DataFrame(rate)
-            self._rate_rx_df.index = pd.to_datetime(
-                    self._rate_rx_df['time'], unit='ms')
-            self._rate_rx_df['bytes'] = self._rate_rx_df['bytes'].apply(
-                    lambda x: x * 8)
-            self._rate_rx_df = self._rate_rx_df.resample('1s').sum()
+            self._rate_rx_df = self.rate_df(rate)
 
     def set_dgram_tx(self, dgram):
         if len(dgram) > 0:
-            self._dgram_tx_df = pd.DataFrame(dgram)
-            self._dgram_tx_df.index = pd.to_datetime(
-                    self._dgram_tx_df['time'], unit='ms')
-            self._dgram_tx_df['bytes'] = self._dgram_tx_df['bytes'].apply(
-                    lambda x: x * 8)
-            self._dgram_tx_df = self._dgram_tx_df.resample('1s').sum()
+            self._dgram_tx_df = self.rate_df(dgram)
 
     def set_stream_tx(self, stream):
         if len(stream) > 0:
-            self._stream_tx_df = pd.DataFrame(stream)
-            self._stream_tx_df.index = pd.to_datetime(
-                    self._stream_tx_df['time'], unit='ms')
-            self._stream_tx_df['bytes'] = self._stream_tx_df['bytes'].apply(
-                    lambda x: x * 8)
-            self._stream_tx_df = self._stream_tx_df.resample('1s').sum()
+            self._stream_tx_df = self.rate_df(stream)
 
     def set_rate_tx(self, rate):
         if len(rate) > 0:
-            self._rate_tx_df = pd.DataFrame(rate)
-            self._rate_tx_df.index = pd.to_datetime(
-                    self._rate_tx_df['time'], unit='ms')
-            self._rate_tx_df['bytes'] = self._rate_tx_df['bytes'].apply(
-                    lambda x: x * 8)
-            self._rate_tx_df = self._rate_tx_df.resample('1s').sum()
+            self._rate_tx_df = self.rate_df(rate)
 
     def set_packet_loss(self, loss):
         if len(loss) > 0:
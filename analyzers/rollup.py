@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+# bin widths in ms, each level is computed from the previous one
+RESOLUTIONS = [10, 100, 1000, 10000]
+FIELDS = ['sum', 'min', 'max', 'count']
+
+
+def empty_rollup():
+    return {
+        'start': np.empty(0, dtype=np.int64),
+        'sum': np.empty(0),
+        'min': np.empty(0),
+        'max': np.empty(0),
+        'count': np.empty(0, dtype=np.int64),
+    }
+
+
+def bin_starts(bins):
+    return np.flatnonzero(np.concatenate(([True], bins[1:] != bins[:-1])))
+
+
+def rollup(times, values, resolution):
+    # Aggregates samples at times in ms into bins of resolution ms. Only bins
+    # that contain samples are stored.
+    times = np.asarray(times, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    keep = np.isfinite(values)
+    times, values = times[keep], values[keep]
+    if len(times) == 0:
+        return empty_rollup()
+    order = np.argsort(times, kind='stable')
+    times, values = times[order], values[order]
+
+    bins = times // resolution
+    starts = bin_starts(bins)
+    return {
+        'start': bins[starts] * resolution,
+        'sum': np.add.reduceat(values, starts),
+        'min': np.minimum.reduceat(values, starts),
+        'max': np.maximum.reduceat(values, starts),
+        'count': np.diff(np.append(starts, len(values))),
+    }
+
+
+def coarsen(r, resolution):
+    if len(r['start']) == 0:
+        return empty_rollup()
+    bins = r['start'] // resolution
+    starts = bin_starts(bins)
+    return {
+        'start': bins[starts] * resolution,
+        'sum': np.add.reduceat(r['sum'], starts),
+        'min': np.minimum.reduceat(r['min'], starts),
+        'max': np.maximum.reduceat(r['max'], starts),
+        'count': np.add.reduceat(r['count'], starts),
+    }
+
+
+def rollups(times, values, resolutions=RESOLUTIONS):
+    r = rollup(times, values, resolutions[0])
+    levels = {resolutions[0]: r}
+    for resolution in resolutions[1:]:
+        r = coarsen(r, resolution)
+        levels[resolution] = r
+    return levels
+
+
+def save_rollups(file, series):
+    # series maps names to (times in ms, values)
+    arrays = {}
+    for name, (times, values) in series.items():
+        for resolution, r in rollups(times, values).items():
+            for field, a in r.items():
+                arrays[f'{name}:{resolution}:{field}'] = a
+    np.savez_compressed(file, **arrays)
+
+
+def rollup_names(file):
+    with np.load(file) as data:
+        return sorted({key.split(':', 1)[0] for key in data.files})
+
+
+def resolution_for(span, max_points, resolutions=RESOLUTIONS):
+    # finest resolution that shows span ms in at most max_points bins
+    for resolution in resolutions:
+        if span / resolution <= max_points:
+            return resolution
+    return resolutions[-1]
+
+
+def read_rollup(file, name, start=None, end=None, resolution=None,
+                max_points=2000):
+    # Reads one series between start and end ms. Members of the npz file are
+    # loaded on access, so only the coarsest level (to find the span) and the
+    # selected resolution are read.
+    with np.load(file) as data:
+        if f'{name}:{RESOLUTIONS[-1]}:start' not in data.files:
+            return None
+        if resolution is None:
+            coarse = data[f'{name}:{RESOLUTIONS[-1]}:start']
+            if len(coarse) == 0:
+                return pd.DataFrame(columns=FIELDS)
+            lo = coarse[0] if start is None else start
+            hi = coarse[-1] + RESOLUTIONS[-1] if end is None else end
+            resolution = resolution_for(hi - lo, max_points)
+
+        starts = data[f'{name}:{resolution}:start']
+        lo = 0 if start is None else np.searchsorted(starts, start)
+        hi = len(starts) if end is None else np.searchsorted(starts, end)
+        df = pd.DataFrame({
+            field: data[f'{name}:{resolution}:{field}'][lo:hi]
+            for field in FIELDS
+        }, index=pd.to_datetime(starts[lo:hi], unit='ms'))
+    df.index.name = 'time'
+    df.attrs['resolution'] = resolution
+    return df
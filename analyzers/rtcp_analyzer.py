@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+from analyzers.windows import RateWindow, to_ms, window_rate, window_sums
+
+# sender and receiver dumps of RTPoverQUIC, inbound and outbound dumps of
+# PionABR
+FEEDBACK_SENT = ['receiver.rtcp', 'receiver_outbound.rtcp']
+FEEDBACK_RECEIVED = ['sender.rtcp', 'sender_inbound.rtcp']
+# relative change of the target rate that counts as a reaction to feedback
+REACTION_THRESHOLD = 0.05
+# reports without a reaction within this many ms are not paired
+REACTION_HORIZON = 1000
+
+
+def read_rtcp(file):
+    # Lines start with the ms timestamp of a compound packet, followed by
+    # its size in bytes. Both RFC 8888 and TWCC feedback are counted the same
+    # way, remaining columns are ignored.
+    with open(file) as f:
+        first = f.readline()
+    sep = '\t' if '\t' in first else ','
+    columns = min(2, len(first.split(sep)))
+    df = pd.read_csv(
+        file,
+        sep=sep,
+        header=None,
+        names=['time', 'size'][:columns],
+        usecols=list(range(columns)),
+        skipinitialspace=True,
+    )
+    if 'size' not in df.columns:
+        df['size'] = np.nan
+    df['size'] = pd.to_numeric(df['size'], errors='coerce')
+    return df
+
+
+class RTCPAnalyzer():
+    def __init__(self, rate_window=RateWindow()):
+        self.rate_window = rate_window
+        self.times: np.ndarray = None
+        self.sizes: np.ndarray = None
+
+    def read(self, file, basetime):
+        df = read_rtcp(file)
+        order = np.argsort(df['time'].to_numpy(), kind='stable')
+        self.times = df['time'].to_numpy(dtype=np.int64)[order] - basetime
+        self.sizes = df['size'].to_numpy(dtype=float)[order]
+
+    def feedback_rate(self):
+        # reports per second
+        starts, counts = window_sums(
+                self.times, np.ones(len(self.times)), self.rate_window)
+        return pd.Series(
+                counts * 1000 / self.rate_window.window,
+                index=pd.to_datetime(starts, unit='ms'))
+
+    def bitrate(self):
+        return window_rate(self.times, self.sizes, self.rate_window)
+
+    def overhead(self, media):
+        # feedback bit rate relative to the bit rate of the media frame
+        feedback = self.bitrate()
+        rate = window_rate(to_ms(media.index), media['rate'], self.rate_window)
+        rate = rate.reindex(feedback.index)
+        return feedback / rate.where(rate > 0)
+
+    def intervals(self):
+        return np.diff(self.times)
+
+    def reaction_times(self, target, threshold=REACTION_THRESHOLD,
+                       horizon=REACTION_HORIZON):
+        # Time from each feedback report to the first change of the target
+        # rate by more than threshold relative to the target at the report.
+        # Small adjustments are not counted as reactions.
+        values = target.to_numpy(dtype=float)
+        times = to_ms(target.index)
+        starts = np.searchsorted(times, self.times, side='right')
+        ends = np.searchsorted(times, self.times + horizon, side='right')
+        valid = starts > 0
+        reports, starts, ends = self.times[valid], starts[valid], ends[valid]
+        baseline = values[starts - 1]
+        margin = threshold * np.abs(baseline)
+        low, high = baseline - margin, baseline + margin
+
+        # Minimum and maximum of values[i:i + 2**k] for every level k, then
+        # advance each report over the largest blocks that stay within its
+        # margin. NaN targets never count as a change, like in a comparison.
+        mins, maxs = [values], [values]
+        while 2 ** len(mins) <= len(values):
+            step = 2 ** (len(mins) - 1)
+            mins.append(np.fmin(mins[-1][:-step], mins[-1][step:]))
+            maxs.append(np.fmax(maxs[-1][:-step], maxs[-1][step:]))
+        first = starts.copy()
+        for k in reversed(range(len(mins))):
+            fits = first + 2 ** k <= len(values)
+            i = first[fits]
+            inside = ~((mins[k][i] < low[fits]) | (maxs[k][i] > high[fits]))
+            first[np.flatnonzero(fits)[inside]] += 2 ** k
+
+        reacted = first < ends
+        return (times[first[reacted]] - reports[reacted]).astype(float)
+
+    def summary(self, media=None, reactions=None):
+        if len(self.times) == 0:
+            return {'reports': 0}
+        duration = max(1, self.times[-1] - self.times[0]) / 1000
+        summary = {
+            'reports': len(self.times),
+            'feedback_rate_mean': len(self.times) / duration,
+            'bitrate_mean': float(np.nansum(self.sizes)) * 8 / duration,
+            'interval_ms': percentiles(self.intervals()),
+        }
+        if media is not None:
+            overhead = self.overhead(media).to_numpy()
+            overhead = overhead[np.isfinite(overhead)]
+            if len(overhead) > 0:
+                summary['overhead_mean'] = float(overhead.mean())
+        if reactions is not None:
+            summary['reaction_ms'] = percentiles(reactions)
+        return summary
+
+
+def percentiles(values, ps=(50, 90, 95, 99)):
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return {}
+    return dict(zip(
+        [f'p{p}' for p in ps] + ['max'],
+        np.percentile(values, list(ps) + [100]).tolist(),
+    ))
@@ -0,0 +1,138 @@
+import math
+
+import numpy as np
+
+
+class DDSketch():
+    # Quantile sketch with relative error guarantees, see Masson et al.,
+    # "DDSketch: A Fast and Fully-Mergeable Quantile Sketch with
+    # Relative-Error Guarantees". Values are counted in logarithmically sized
+    # buckets, two sketches with the same accuracy merge by adding counts.
+
+    def __init__(self, relative_accuracy=0.01, unit=''):
+        self.relative_accuracy = relative_accuracy
+        self.unit = unit
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        keys = np.ceil(np.log(positive) / self._log_gamma).astype(np.int64)
+        keys, counts = np.unique(keys, return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.bins[key] = self.bins.get(key, 0) + count
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('can not merge sketches of different accuracy')
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                value = 2 * self._gamma ** key / (self._gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def percentiles(self, ps=(50, 90, 95, 99)):
+        return {f'p{p}': self.quantile(p / 100) for p in ps}
+
+    def to_json(self):
+        keys = sorted(self.bins)
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'unit': self.unit,
+            'count': self.count,
+            'zero_count': self.zero_count,
+            'min': self.min if self.count > 0 else None,
+            'max': self.max if self.count > 0 else None,
+            'keys': keys,
+            'counts': [self.bins[k] for k in keys],
+        }
+
+    @staticmethod
+    def from_json(data):
+        sketch = DDSketch(data['relative_accuracy'], data.get('unit', ''))
+        sketch.bins = dict(zip(data['keys'], data['counts']))
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        if sketch.count > 0:
+            sketch.min = data['min']
+            sketch.max = data['max']
+        return sketch
+
+
+def rolling_quantiles(times, values, rate_window, qs,
+                      relative_accuracy=0.01):
+    # Quantiles of values at ms times over windows that start every step ms.
+    # Values are counted in DDSketch buckets per step and every window adds
+    # up the steps it covers through prefix sums, so the cost grows with the
+    # number of samples plus steps x buckets but not with the overlap. The
+    # window is rounded up to a multiple of the step. Like DDSketch.add,
+    # values <= 0 are counted as zero, in bucket 0.
+    times = np.asarray(times, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    keep = np.isfinite(values)
+    times, values = times[keep], values[keep]
+    if len(times) == 0:
+        return np.empty(0, dtype=np.int64), np.empty((len(qs), 0))
+
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    positive = values > 0
+    keys = np.zeros(len(values), dtype=np.int64)
+    keys[positive] = np.ceil(
+            np.log(values[positive]) / math.log(gamma)).astype(np.int64)
+    lowest = keys[positive].min() if positive.any() else 0
+    buckets = int(keys.max() - lowest) + 2 if positive.any() else 1
+    columns = np.where(positive, keys - lowest + 1, 0)
+
+    step = rate_window.step
+    start = times.min() // step * step
+    steps = int((times.max() - start) // step) + 1
+    per_step = np.bincount(
+            (times - start) // step * buckets + columns,
+            minlength=steps * buckets,
+        ).reshape(steps, buckets)
+    prefix = np.zeros((steps + 1, buckets), dtype=np.int64)
+    np.cumsum(per_step, axis=0, out=prefix[1:])
+
+    span = max(1, -(-rate_window.window // step))
+    ends = np.minimum(np.arange(steps) + span, steps)
+    cumulative = np.cumsum(prefix[ends] - prefix[:steps], axis=1)
+    total = cumulative[:, -1]
+
+    result = np.empty((len(qs), steps))
+    for i, q in enumerate(qs):
+        # same rank rule as DDSketch.quantile
+        rank = q * (total - 1)
+        column = np.argmax(cumulative > rank[:, None], axis=1)
+        key = (column - 1 + lowest).astype(float)
+        value = np.where(column > 0, 2 * gamma ** key / (gamma + 1), 0.0)
+        result[i] = np.where(total > 0, value, np.nan)
+    return start + np.arange(steps, dtype=np.int64) * step, result
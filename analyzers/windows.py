@@ -0,0 +1,69 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+
+def to_ms(index):
+    return np.asarray(
+            (index - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1),
+            dtype=np.int64)
+
+
+class RateWindow(NamedTuple):
+    window: int = 1000
+    step: int = 1000
+
+
+def window_sums(times, values, rate_window, start=None, end=None):
+    # Sums values at integer ms times over windows [t, t + window) that start
+    # every step ms. Samples are binned per ms and accumulated once, each
+    # window is the difference of two prefix sums, so overlapping windows cost
+    # no more than disjoint ones. start and end fix the range of the windows,
+    # e.g. to align several series, by default it covers all samples.
+    times = np.asarray(times, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    keep = np.isfinite(values)
+    if start is not None:
+        keep &= times >= start
+    if end is not None:
+        keep &= times <= end
+    times, values = times[keep], values[keep]
+    if len(times) == 0 and (start is None or end is None):
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    if start is None:
+        start = times.min() // rate_window.step * rate_window.step
+    if end is None:
+        end = times.max()
+    length = int(end - start) + 1
+    per_ms = np.bincount(
+            times - start, weights=values, minlength=length)[:length]
+    prefix = np.concatenate(([0.0], np.cumsum(per_ms)))
+    offsets = np.arange(0, length, rate_window.step)
+    ends = np.minimum(offsets + rate_window.window, length)
+    return start + offsets, prefix[ends] - prefix[offsets]
+
+
+def window_rate(times, sizes, rate_window, start=None, end=None):
+    # bit/s of byte sizes at times in ms
+    starts, sums = window_sums(times, sizes, rate_window, start, end)
+    return pd.Series(
+            sums * 8 * 1000 / rate_window.window,
+            index=pd.to_datetime(starts, unit='ms'),
+            name='rate',
+        )
+
+
+def rate_window(args):
+    step = args.rate_window if args.rate_step is None else args.rate_step
+    return RateWindow(args.rate_window, step)
+
+
+def add_rate_window_args(parser):
+    parser.add_argument('--rate-window', type=int, default=1000,
+                        help='window in ms for rate, loss and utilization '
+                        'computations')
+    parser.add_argument('--rate-step', type=int,
+                        help='ms between the starts of two windows, defaults '
+                        'to the window size')
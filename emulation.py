@@ -1,12 +1,20 @@
 from abc import ABC, abstractmethod
 from typing import NamedTuple
 
+import glob
 import os
+import signal
 import subprocess
 import time
 
 from mininet.topo import Topo
 
+from jobs import Job
+from link_control import link_control
+from monitor import kill
+
+CAPTURE_MODES = ['off', 'header', 'ring']
+
 
 class LinkConfig(NamedTuple):
     start_time: int = 0
@@ -26,6 +34,14 @@ class LinkConfig(NamedTuple):
             ]])
 
 
+class CaptureConfig(NamedTuple):
+    mode: str = 'header'
+    snaplen: int = 88
+    filesize: int = 10
+    filecount: int = 10
+    compress: bool = False
+
+
 class DumbbellTopo(Topo):
     def build(self, n=2):
         left_switch = self.addSwitch('ls1')
@@ -48,11 +64,22 @@ class Emulation(ABC):
     def topology(self):
         pass
 
-    def __init__(self, log_dir, config_id):
+    def __init__(self, log_dir, config_id, link_control_name='tc-batch',
+                 capture=CaptureConfig()):
+        if capture.mode not in CAPTURE_MODES:
+            raise ValueError('unknown capture mode: {}'.format(capture.mode))
         self._log_dir = log_dir
         self._config_id = config_id
         self._log_file = os.path.join(self._log_dir, 'link.log')
+        self._apply_log_file = os.path.join(self._log_dir, 'link_apply.log')
         self._queue = None
+        self._last_config = None
+        self._log = None
+        self._apply_log = None
+        self._link_control = link_control(link_control_name)
+        self._capture = capture
+        self._captures = []
+        self._monitor = None
 
     @staticmethod
     @abstractmethod
@@ -68,39 +95,121 @@ class Emulation(ABC):
         pass
 
     @abstractmethod
-    def schedule_link_emulation(self, start_time):
+    def schedule_link_emulation(self, scheduler):
         pass
 
     @abstractmethod
     def get_link_update_cmds(config: LinkConfig):
         pass
 
-    def tcpdump(self, net, log_dir):
-        pass
+    def capture_interfaces(self):
+        return []
+
+    def capture_file(self, iface):
+        return os.path.join(self._log_dir, '{}.pcap'.format(iface))
+
+    def tcpdump(self, net, ports):
+        # Only UDP and TCP packets from or to one of ports are captured, so
+        # ports has to contain the ports of all flows.
+        if self._capture.mode == 'off':
+            return
+        bpf = ' or '.join(
+                f'udp port {port} or tcp port {port}' for port in ports)
+        FNULL = open(os.devnull, 'w')
+        for iface in self.capture_interfaces():
+            cmd = [
+                'tcpdump', '-i', iface,
+                '-s', str(self._capture.snaplen),
+                '-w', self.capture_file(iface),
+            ]
+            if self._capture.mode == 'ring':
+                cmd.extend([
+                    '-C', str(self._capture.filesize),
+                    '-W', str(self._capture.filecount),
+                ])
+            cmd.append(f'ip and ({bpf})')
+            proc = subprocess.Popen(cmd, stderr=FNULL)
+            if self._monitor is not None:
+                self._monitor.register('tcpdump_{}'.format(iface), proc)
+            self._captures.append(proc)
+
+    def stop_capture(self):
+        for proc in self._captures:
+            kill(proc, signal.SIGTERM)
+        for proc in self._captures:
+            try:
+                self.wait_process(proc, timeout=5)
+            except subprocess.TimeoutExpired:
+                kill(proc)
+                self.wait_process(proc)
+        self._captures = []
+
+    def wait_process(self, proc, timeout=None):
+        if self._monitor is None:
+            return proc.wait(timeout=timeout)
+        return self._monitor.wait(proc, timeout=timeout)
+
+    def capture_json(self):
+        return self._capture._asdict()
+
+    def cleanup_jobs(self):
+        if self._capture.mode == 'off' or not self._capture.compress:
+            return []
+        files = []
+        for iface in self.capture_interfaces():
+            files.extend(glob.glob(self.capture_file(iface) + '*'))
+        return [Job(
+            id=os.path.join(self._log_dir, 'compress_captures'),
+            cmds=[['gzip', '-f', f] for f in files],
+        )]
 
     def set_log_queue(self, queue):
         self._queue = queue
 
+    def set_monitor(self, monitor):
+        self._monitor = monitor
+
+    def link_control_json(self):
+        return self._link_control.config_json()
+
+    def open_link_logs(self):
+        if self._log is None:
+            self._log = open(self._log_file, 'a')
+            self._apply_log = open(self._apply_log_file, 'a')
+
     def close_link_emulation(self):
+        self.stop_capture()
         if self._last_config is not None:
             t = int(time.time() * 1000)
-            with open(self._log_file, 'a') as log:
-                log.write('{},{}\n'.format(
-                    t, self._last_config.get_log_line()))
+            self._log.write('{},{}\n'.format(
+                t, self._last_config.get_log_line()))
+        if self._log is not None:
+            self._log.close()
+            self._apply_log.close()
+            self._log = None
+            self._apply_log = None
 
     def update_link(self, config: LinkConfig):
         cmds = self.get_link_update_cmds(config)
+        self.open_link_logs()
         t = int(time.time() * 1000)
+        latency = self._link_control.apply(cmds)
         self._last_config = config
-        for cmd in cmds:
-            subprocess.run(cmd.split(' '))
-            if self._queue is not None:
+        if self._queue is not None:
+            for cmd in cmds:
                 self._queue.put(cmd)
-        with open(self._log_file, 'a') as log:
-            log.write('{},{}\n'.format(t, config.get_log_line()))
+        self._log.write('{},{}\n'.format(t, config.get_log_line()))
+        self._log.flush()
+        self._apply_log.write('{},{:.3f}\n'.format(t, latency * 1000))
 
 
 class EmulationBuilder():
     @abstractmethod
     def build(self, log_dir, config_id):
         pass
+
+    def parameters(self):
+        # Runtime and parameters of the emulation the builder builds.
+        # Builders whose emulations are expensive to create override this.
+        config = self.build('', '').config_json()
+        return config['runtime'], config['parameters']
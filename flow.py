@@ -1,12 +1,25 @@
 from abc import ABC, abstractmethod
 from pathlib import Path
 from subprocess import PIPE
-from threading import Thread
+from threading import Event, Thread
 
 import os
 
+from monitor import exited, kill
+
+# seconds between two checks whether a client exited on its own
+EXIT_POLL_INTERVAL = 0.1
+
 
 class Flow(ABC):
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def log_dir(self):
+        return self._log_dir
+
     @property
     def delay(self):
         return self._delay
@@ -19,6 +32,19 @@ class Flow(ABC):
     def receiver_node(self):
         return self._receiver_node
 
+    @property
+    def client_exited(self):
+        return self._client_exited
+
+    @property
+    def client_returncode(self):
+        # None unless the client exited before the end of the run
+        return self._client_returncode
+
+    @property
+    def errors(self):
+        return self._errors
+
     @abstractmethod
     def __init__(self, id, server_node, receiver_node, delay, log_dir):
         self._id = id
@@ -26,6 +52,10 @@ class Flow(ABC):
         self._receiver_node = receiver_node
         self._delay = delay
         self._log_dir = log_dir
+        self._monitor = None
+        self._client_exited = Event()
+        self._client_returncode = None
+        self._errors = []
 
     @staticmethod
     @abstractmethod
@@ -47,14 +77,29 @@ class Flow(ABC):
     def config_json(self):
         pass
 
-    def cleanup(self):
-        pass
+    def cleanup_jobs(self):
+        return []
+
+    def set_monitor(self, monitor):
+        self._monitor = monitor
+
+    def add_error(self, q, error):
+        # errors that invalidate the run, written to config.json
+        q.put('flow_{}: error: {}'.format(self._id, error))
+        self._errors.append(error)
+
+    def wait_process(self, proc, timeout=None):
+        if self._monitor is None:
+            return proc.wait(timeout=timeout)
+        return self._monitor.wait(proc, timeout=timeout)
 
     def start_server(self, q, end_event, host, addr, port):
         Path(self._log_dir).mkdir(parents=True, exist_ok=True)
         cmd = self.server_cmd(addr, port)
         q.put('server_{}_cmd: {}'.format(self._id, cmd))
         proc = host.popen(cmd, stderr=PIPE, stdout=PIPE)
+        if self._monitor is not None:
+            self._monitor.register('server_{}'.format(self._id), proc)
         threads = []
         streams = {'stdout': proc.stdout, 'stderr': proc.stderr}
         for name, stream in streams.items():
@@ -71,7 +116,8 @@ class Flow(ABC):
             comm.start()
 
         end_event.wait()
-        proc.kill()
+        kill(proc)
+        self.wait_process(proc)
 
         for t in threads:
             t.join()
@@ -81,6 +127,8 @@ class Flow(ABC):
         cmd = self.client_cmd(addr, port)
         q.put('client_{}_cmd: {}'.format(self._id, cmd))
         proc = host.popen(cmd, stderr=PIPE, stdout=PIPE)
+        if self._monitor is not None:
+            self._monitor.register('client_{}'.format(self._id), proc)
         threads = []
         streams = {'stdout': proc.stdout, 'stderr': proc.stderr}
         for name, stream in streams.items():
@@ -96,8 +144,18 @@ class Flow(ABC):
             threads.append(comm)
             comm.start()
 
-        end_event.wait()
-        proc.kill()
+        done = False
+        while not end_event.wait(EXIT_POLL_INTERVAL):
+            if exited(proc):
+                done = True
+                break
+        kill(proc)
+        self.wait_process(proc)
+        if done:
+            self._client_returncode = proc.returncode
+            q.put('client_{}: exited with {}'.format(
+                self._id, proc.returncode))
+        self._client_exited.set()
 
         for t in threads:
             t.join()
@@ -87,6 +87,14 @@ class Iperf3(Flow):
 
     def config_json(self):
         return {
+            'name': 'iperf3',
             'congestion_control_algorithm': self._congestion_control_algorithm,
             'duration': self._duration,
+            'log_dir': self._log_dir,
+            'parameters': {
+                'transport': 'tcp',
+                'transport-cc': self._congestion_control_algorithm,
+                'id': self._id,
+            },
+            'id': self._id,
         }
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import BoundedSemaphore, Lock
+from typing import NamedTuple
+
+# niceness of work running next to the experiments, so that it does not take
+# CPU from the flows under test
+NICE = 10
+
+
+class Job(NamedTuple):
+    id: str
+    cmds: list
+    remove: list = []
+
+
+def run_job(job: Job, nice=0):
+    ok = True
+    for cmd in job.cmds:
+        if nice > 0:
+            cmd = ['nice', '-n', str(nice)] + cmd
+        print(f'job {job.id} cmd: "{" ".join(cmd)}"')
+        if subprocess.run(cmd).returncode != 0:
+            ok = False
+            break
+    # the removed files are the inputs of the commands, e.g. the only copy
+    # of the received video, so they are kept to retry a failed job
+    if ok:
+        for f in job.remove:
+            Path(f).unlink(missing_ok=True)
+    return ok
+
+
+class JobQueue():
+    def __init__(self, state_file, workers=2, max_pending=8, nice=NICE):
+        self._state_file = state_file
+        self._nice = nice
+        self._lock = Lock()
+        self._pending = BoundedSemaphore(max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._jobs = {}
+        self.resume()
+
+    def resume(self):
+        if not os.path.isfile(self._state_file):
+            return
+        with open(self._state_file) as f:
+            jobs = json.load(f)
+        # failed jobs are kept for inspection, finished ones are dropped
+        self._jobs = {
+            id: job for id, job in jobs.items() if job['state'] == 'failed'}
+        for job in jobs.values():
+            if job['state'] in ['pending', 'running']:
+                print('resuming job {}'.format(job['job']['id']))
+                self.submit(Job(**job['job']))
+
+    def save(self):
+        tmp = self._state_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._jobs, f)
+        os.replace(tmp, self._state_file)
+
+    def set_state(self, job, state):
+        with self._lock:
+            if state == 'done':
+                self._jobs.pop(job.id, None)
+            else:
+                self._jobs[job.id] = {
+                    'job': job._asdict(),
+                    'state': state,
+                }
+            self.save()
+
+    def submit(self, job: Job):
+        # Blocks while too many jobs are queued, so that unprocessed output
+        # (e.g. raw video) does not pile up on disk.
+        self._pending.acquire()
+        self.set_state(job, 'pending')
+        self._executor.submit(self.run, job)
+
+    def run(self, job: Job):
+        self.set_state(job, 'running')
+        try:
+            ok = run_job(job, self._nice)
+            self.set_state(job, 'done' if ok else 'failed')
+        except Exception as e:
+            print('job {} failed: {}'.format(job.id, e))
+            self.set_state(job, 'failed')
+        finally:
+            self._pending.release()
+
+    def wait(self):
+        self._executor.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--data-dir', default='data/',
+                        help='data directory containing jobs.json')
+    parser.add_argument('--jobs', type=int, default=2,
+                        help='number of parallel jobs')
+    args = parser.parse_args()
+
+    queue = JobQueue(
+            os.path.join(args.data_dir, 'jobs.json'),
+            workers=args.jobs,
+            max_pending=1 << 16,
+        )
+    queue.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+from abc import ABC, abstractmethod
+
+import subprocess
+import time
+
+
+class LinkControl(ABC):
+    def __init__(self):
+        self._latencies = []
+
+    @property
+    @abstractmethod
+    def name(self):
+        pass
+
+    @abstractmethod
+    def run(self, cmds):
+        pass
+
+    def apply(self, cmds):
+        start = time.monotonic()
+        self.run(cmds)
+        latency = time.monotonic() - start
+        self._latencies.append(latency)
+        return latency
+
+    def config_json(self):
+        latencies = [x * 1000 for x in self._latencies]
+        return {
+            'name': self.name,
+            'updates': len(latencies),
+            'apply_latency_ms': {
+                'mean': sum(latencies) / len(latencies) if latencies else 0,
+                'max': max(latencies, default=0),
+            },
+        }
+
+
+class SubprocessLinkControl(LinkControl):
+    name = 'tc'
+
+    def run(self, cmds):
+        for cmd in cmds:
+            subprocess.run(cmd.split(' '))
+
+
+class BatchLinkControl(LinkControl):
+    name = 'tc-batch'
+
+    def run(self, cmds):
+        batch = '\n'.join(cmd.removeprefix('tc ') for cmd in cmds) + '\n'
+        subprocess.run(
+                ['tc', '-force', '-batch', '-'],
+                input=batch.encode('utf-8'),
+            )
+
+
+LINK_CONTROLS = {
+    SubprocessLinkControl.name: SubprocessLinkControl,
+    BatchLinkControl.name: BatchLinkControl,
+}
+
+
+def link_control(name):
+    if name not in LINK_CONTROLS:
+        raise ValueError('unknown link control: {}'.format(name))
+    return LINK_CONTROLS[name]()
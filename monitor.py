@@ -0,0 +1,194 @@
+import json
+import os
+import signal
+import subprocess
+import threading
+import time
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def read_stat(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        # the command name may contain spaces, fields start after it
+        fields = f.read().rsplit(')', 1)[1].split()
+    return {
+        'utime_ms': int(fields[11]) * 1000 // CLOCK_TICKS,
+        'stime_ms': int(fields[12]) * 1000 // CLOCK_TICKS,
+        'threads': int(fields[17]),
+    }
+
+
+def read_status(pid):
+    status = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            status[key] = value.split()
+    return {
+        'rss_kb': int(status.get('VmRSS', [0])[0]),
+        'voluntary': int(status.get('voluntary_ctxt_switches', [0])[0]),
+        'involuntary': int(
+            status.get('nonvoluntary_ctxt_switches', [0])[0]),
+    }
+
+
+def cgroup_cpu_stat(pid):
+    # cpu.stat of the process's cgroup, cgroup v2 or the v1 cpu controller
+    with open(f'/proc/{pid}/cgroup') as f:
+        for line in f:
+            _, controllers, path = line.strip().split(':', 2)
+            path = path.lstrip('/')
+            if controllers == '':
+                candidates = [os.path.join('/sys/fs/cgroup', path)]
+            elif 'cpu' in controllers.split(','):
+                candidates = [
+                    os.path.join('/sys/fs/cgroup', c, path)
+                    for c in [controllers, 'cpu', 'cpu,cpuacct']
+                ]
+            else:
+                continue
+            for c in candidates:
+                if os.path.isfile(os.path.join(c, 'cpu.stat')):
+                    return os.path.join(c, 'cpu.stat')
+    return None
+
+
+def read_throttling(file):
+    if file is None:
+        return {'nr_throttled': 0, 'throttled_us': 0}
+    stat = {}
+    with open(file) as f:
+        for line in f:
+            key, value = line.split()
+            stat[key] = int(value)
+    throttled_us = stat.get('throttled_usec')
+    if throttled_us is None:
+        # cgroup v1 reports nanoseconds
+        throttled_us = stat.get('throttled_time', 0) // 1000
+    return {
+        'nr_throttled': stat.get('nr_throttled', 0),
+        'throttled_us': throttled_us,
+    }
+
+
+def kill(proc, sig=signal.SIGKILL):
+    # Popen.kill and Popen.terminate poll first, which would reap a process
+    # that already exited before ResourceMonitor.wait can record its rusage.
+    # The pid can not be reused until the process is reaped.
+    if proc.returncode is not None:
+        return
+    try:
+        os.kill(proc.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def exited(proc):
+    # Like Popen.poll, but leaves the exited process to be reaped by
+    # ResourceMonitor.wait.
+    if proc.returncode is not None:
+        return True
+    try:
+        return os.waitid(
+                os.P_PID, proc.pid,
+                os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+    except ChildProcessError:
+        return True
+
+
+class ResourceMonitor():
+    # Samples CPU time, RSS, context switches and cgroup throttling of the
+    # registered processes every interval seconds into resources.log. Lines
+    # are 'time in ms,name,pid,utime ms,stime ms,rss kB,threads,voluntary
+    # switches,involuntary switches,throttled periods,throttled us'. The
+    # final rusage of every process is written to rusage.json.
+
+    def __init__(self, log_dir, interval=0.1):
+        self._log_file = os.path.join(log_dir, 'resources.log')
+        self._rusage_file = os.path.join(log_dir, 'rusage.json')
+        self._interval = interval
+        self._processes = {}
+        self._rusage = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._log = None
+
+    def register(self, name, proc):
+        with self._lock:
+            self._processes[proc.pid] = name
+
+    def start(self):
+        self._log = open(self._log_file, 'w')
+        if self._interval > 0:
+            self._thread = threading.Thread(target=self.run)
+            self._thread.start()
+
+    def run(self):
+        while not self._stop.wait(self._interval):
+            self.sample()
+
+    def sample(self):
+        t = int(time.time() * 1000)
+        with self._lock:
+            processes = list(self._processes.items())
+        lines = []
+        for pid, name in processes:
+            try:
+                sample = read_stat(pid) | read_status(pid) | \
+                    read_throttling(cgroup_cpu_stat(pid))
+            except (OSError, ValueError, IndexError):
+                # exited between two samples
+                continue
+            lines.append(','.join(str(x) for x in [
+                t, name, pid,
+                sample['utime_ms'], sample['stime_ms'], sample['rss_kb'],
+                sample['threads'], sample['voluntary'],
+                sample['involuntary'], sample['nr_throttled'],
+                sample['throttled_us'],
+            ]))
+        if len(lines) > 0:
+            self._log.write('\n'.join(lines) + '\n')
+            self._log.flush()
+
+    def wait(self, proc, timeout=None):
+        # Reaps proc with wait4 to record its final rusage. Raises
+        # subprocess.TimeoutExpired like Popen.wait.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+            except ChildProcessError:
+                # already reaped elsewhere
+                return proc.wait()
+            if pid != 0:
+                break
+            if deadline is not None and time.monotonic() > deadline:
+                raise subprocess.TimeoutExpired(proc.args, timeout)
+            time.sleep(0.01)
+
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        with self._lock:
+            name = self._processes.pop(proc.pid, str(proc.pid))
+            self._rusage[name] = {
+                'pid': proc.pid,
+                'returncode': proc.returncode,
+                'utime_s': rusage.ru_utime,
+                'stime_s': rusage.ru_stime,
+                'maxrss_kb': rusage.ru_maxrss,
+                'minflt': rusage.ru_minflt,
+                'majflt': rusage.ru_majflt,
+                'nvcsw': rusage.ru_nvcsw,
+                'nivcsw': rusage.ru_nivcsw,
+            }
+        return proc.returncode
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._log is not None:
+            self._log.close()
+        with open(self._rusage_file, 'w') as f:
+            json.dump(self._rusage, f)
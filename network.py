@@ -0,0 +1,147 @@
+import os
+import signal
+import time
+
+from mininet.clean import cleanup
+from mininet.net import Mininet
+from mininet.util import dumpNodeConnections
+
+# root qdiscs the kernel installs by itself, anything else was left over by a
+# link emulation
+DEFAULT_QDISCS = ['noqueue', 'pfifo_fast', 'fq_codel', 'fq', 'mq']
+
+
+def topology_key(topo):
+    # Two topologies can share a network if they have the same nodes, node
+    # parameters and links.
+    return repr((
+        type(topo).__name__,
+        [(n, topo.nodeInfo(n)) for n in topo.nodes()],
+        topo.links(sort=True, withInfo=True),
+    ))
+
+
+def namespace_processes(host):
+    # processes in the network namespace of host, except for its shell
+    try:
+        namespace = os.readlink('/proc/{}/ns/net'.format(host.pid))
+    except OSError:
+        return []
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit() or int(entry) == host.pid:
+            continue
+        try:
+            if os.readlink('/proc/{}/ns/net'.format(entry)) == namespace:
+                pids.append(int(entry))
+        except OSError:
+            continue
+    return pids
+
+
+def root_qdiscs(node, intf):
+    out = node.cmd('tc qdisc show dev {} root'.format(intf))
+    return [line.split()[1] for line in out.splitlines()
+            if line.startswith('qdisc ')]
+
+
+class Network():
+    # Keeps a started Mininet network for consecutive test configs with the
+    # same topology. Between two runs only the qdiscs, ARP caches, TCP
+    # metrics and processes of the hosts are reset. If the network is not
+    # clean after the reset, it is torn down and the next run builds a fresh
+    # one.
+
+    def __init__(self, reuse=True):
+        self.reuse = reuse
+        self.net = None
+        self._key = None
+
+    def start(self, topo):
+        key = topology_key(topo)
+        if self.net is not None and key == self._key:
+            print('reusing network')
+            return self.net
+        self.stop()
+        self.net = Mininet(topo=topo, autoStaticArp=True)
+        dumpNodeConnections(self.net.hosts)
+        self.net.start()
+        self._key = key
+        return self.net
+
+    def release(self, clean=True):
+        # called after every run, clean is False if the run failed
+        if self.net is None:
+            return
+        if not self.reuse or not clean:
+            self.stop()
+            return
+        self.reset()
+        leaks = self.leaks()
+        if len(leaks) > 0:
+            print('network not clean, tearing down: {}'.format(
+                ', '.join(leaks)))
+            self.stop()
+
+    def interfaces(self):
+        for node in self.net.hosts + self.net.switches:
+            for intf in node.intfList():
+                if intf.name != 'lo':
+                    yield node, intf
+
+    def reset(self):
+        for host in self.net.hosts:
+            for pid in namespace_processes(host):
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+        for node, intf in self.interfaces():
+            if any(q not in DEFAULT_QDISCS for q in root_qdiscs(node, intf)):
+                node.cmd('tc qdisc del dev {} root'.format(intf))
+        for host in self.net.hosts:
+            host.cmd('ip neigh flush nud all')
+            # a fresh namespace has no cached ssthresh, RTT and cwnd of
+            # earlier TCP connections
+            host.cmd('ip tcp_metrics flush all')
+        self.net.staticArp()
+        # give the kernel a moment to remove the killed processes
+        deadline = time.monotonic() + 1
+        while time.monotonic() < deadline and any(
+                namespace_processes(h) for h in self.net.hosts):
+            time.sleep(0.05)
+
+    def leaks(self):
+        leaks = []
+        for host in self.net.hosts:
+            if host.shell is None or host.shell.poll() is not None:
+                leaks.append('{}: shell exited'.format(host))
+                continue
+            pids = namespace_processes(host)
+            if len(pids) > 0:
+                leaks.append('{}: processes {}'.format(host, pids))
+            # Only the static entries of the other hosts may remain. IPv6
+            # neighbor discovery is not used by the experiments.
+            for line in host.cmd('ip -4 neigh show').splitlines():
+                if line.strip() and 'PERMANENT' not in line:
+                    leaks.append('{}: neighbor {}'.format(host, line))
+            # entries are '<address> age <seconds> ...', anything else is
+            # an error message of an ip without tcp_metrics support
+            metrics = [line for line in host.cmd(
+                'ip tcp_metrics show').splitlines() if ' age ' in line]
+            if len(metrics) > 0:
+                leaks.append('{}: tcp metrics {}'.format(host, metrics[0]))
+        for node, intf in self.interfaces():
+            qdiscs = [q for q in root_qdiscs(node, intf)
+                      if q not in DEFAULT_QDISCS]
+            if len(qdiscs) > 0:
+                leaks.append('{}: qdiscs {}'.format(intf, qdiscs))
+        return leaks
+
+    def stop(self):
+        if self.net is None:
+            return
+        self.net.stop()
+        cleanup()
+        self.net = None
+        self._key = None
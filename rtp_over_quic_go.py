@@ -6,7 +6,12 @@ import subprocess
 
 from pathlib import Path
 
-from flow import Flow, FlowBuilder
+from threading import Thread
+
+from flow import EXIT_POLL_INTERVAL, Flow, FlowBuilder
+from jobs import NICE, Job
+from monitor import exited, kill
+from video_quality import QUALITY_MODES, intermediate_files, quality_cmds
 
 
 class RTPoverQUICSenderConfig(NamedTuple):
@@ -20,9 +25,20 @@ class RTPoverQUICSenderConfig(NamedTuple):
     mutex_profile: bool = False
 
 
+class RTPoverQUICQualityConfig(NamedTuple):
+    mode: str = 'vmaf'
+    threads: int = 0
+    subsample: int = 1
+    # Compute the quality while the receiver writes the video into a FIFO
+    # instead of a file. The receiver blocks whenever ffmpeg falls behind,
+    # which can change the results of the flow under test.
+    stream: bool = False
+
+
 class RTPoverQUICReceiverConfig(NamedTuple):
     cmd: str = './third_party/rtp-over-quic/rtp-over-quic'
     output: str = 'out.y4m'
+    quality: RTPoverQUICQualityConfig = RTPoverQUICQualityConfig()
     cpu_profile: bool = False
     goroutine_profile: bool = False
     heap_profile: bool = False
@@ -83,6 +99,7 @@ class RTPoverQUIC(Flow):
         Flow.__init__(
                 self, id, server_node, receiver_node, delay, log_dir)
         self._config = config
+        self._quality_failed = False
 
     @staticmethod
     def builders(
@@ -109,13 +126,19 @@ class RTPoverQUIC(Flow):
                 continue
             cleaned_configs.append(c)
 
+        receiver_config = dict(config.get('receiver_config', {}))
+        quality = RTPoverQUICQualityConfig(
+                **receiver_config.pop('quality', {}))
+        if quality.mode not in QUALITY_MODES:
+            raise ValueError('unknown quality mode: {}'.format(quality.mode))
+
         builders = [RTPoverQUICBuilder(
             delay,
             RTPoverQUICCommonConfig(
                 sender_config=RTPoverQUICSenderConfig(
                     **config.get('sender_config', {})),
                 receiver_config=RTPoverQUICReceiverConfig(
-                    **config.get('receiver_config', {})),
+                    **receiver_config, quality=quality),
                 rtp_cc=RTPCongestionControlConfig(**c[3]),
                 transport=RTPTransportConfig(**c[2]),
                 codec=c[0],
@@ -128,7 +151,9 @@ class RTPoverQUIC(Flow):
         return {
             'name': 'rtp-over-quic-go',
             'sender_config': self._config.sender_config._asdict(),
-            'receiver_config': self._config.receiver_config._asdict(),
+            'receiver_config': self._config.receiver_config._asdict() | {
+                'quality': self._config.receiver_config.quality._asdict(),
+            },
             'log_dir': self._log_dir,
             'parameters': {
                 'transport': self._config.transport.protocol,
@@ -138,36 +163,123 @@ class RTPoverQUIC(Flow):
                 'local-rfc8888': self._config.rtp_cc.local_rfc8888,
                 'codec': self._config.codec,
                 'stream': self._config.stream,
+                'quality': self._config.receiver_config.quality.mode,
+                'quality_stream': self.streams_quality(),
                 'id': self._id,
             },
             'id': self._id,
         }
 
-    def cleanup(self):
+    def quality_cmds(self, pipe=False):
+        quality = self._config.receiver_config.quality
+        return quality_cmds(
+                quality.mode,
+                quality.threads,
+                quality.subsample,
+                os.path.join(
+                    self._log_dir, self._config.receiver_config.output),
+                self._config.sender_config.input,
+                os.path.join(self._log_dir, 'video_quality.csv'),
+                pipe=pipe,
+            )
+
+    def streams_quality(self):
+        quality = self._config.receiver_config.quality
+        return quality.stream and quality.mode != 'off' and \
+            os.path.isfile(self._config.sender_config.input)
+
+    def start_server(self, q, end_event, host, addr, port):
+        if not self.streams_quality():
+            return Flow.start_server(self, q, end_event, host, addr, port)
+
+        # The receiver writes into a FIFO that is consumed by the quality
+        # computation, so the decoded video never hits the disk. If ffmpeg
+        # exits early, the receiver's next write fails with EPIPE and the
+        # receiver dies, so the run is marked as failed. ffmpeg runs niced
+        # like the background jobs to keep CPU for the flows under test.
+        q.put('quality_{}: warning: streaming the video into ffmpeg, the '
+              'receiver blocks while ffmpeg falls behind'.format(self._id))
+        Path(self._log_dir).mkdir(parents=True, exist_ok=True)
+        sink = os.path.join(self._log_dir, self._config.receiver_config.output)
+        Path(sink).unlink(missing_ok=True)
+        os.mkfifo(sink)
+        try:
+            cmd = ['nice', '-n', str(NICE)] + self.quality_cmds(pipe=True)[0]
+            q.put('quality_{}_cmd: {}'.format(self._id, cmd))
+            proc = subprocess.Popen(
+                    cmd,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+            if self._monitor is not None:
+                self._monitor.register('quality_{}'.format(self._id), proc)
+            watcher = Thread(
+                    target=self.watch_quality, args=(q, end_event, proc))
+            watcher.start()
+
+            Flow.start_server(self, q, end_event, host, addr, port)
+            watcher.join()
+
+            # Unblock ffmpeg if the receiver never opened the FIFO.
+            try:
+                os.close(os.open(sink, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+            try:
+                self.wait_process(proc, timeout=60)
+            except subprocess.TimeoutExpired:
+                kill(proc)
+                self.wait_process(proc)
+                self.quality_failed(q, 'ffmpeg computing the video quality '
+                                    'timed out and was killed')
+            else:
+                q.put('quality_{}: ffmpeg exited with {}'.format(
+                    self._id, proc.returncode))
+                if proc.returncode != 0 and not self._quality_failed:
+                    self.quality_failed(
+                            q, 'ffmpeg computing the video quality exited '
+                            'with {}'.format(proc.returncode))
+        finally:
+            Path(sink).unlink(missing_ok=True)
+
+    def quality_failed(self, q, error):
+        # The scores of a truncated computation must not be analyzed as if
+        # they covered the whole run.
+        self._quality_failed = True
+        self.add_error(q, error)
+        csv_file = os.path.join(self._log_dir, 'video_quality.csv')
+        quality = self._config.receiver_config.quality
+        for file in [csv_file] + intermediate_files(quality.mode, csv_file):
+            Path(file).unlink(missing_ok=True)
+
+    def watch_quality(self, q, end_event, proc):
+        while not end_event.wait(EXIT_POLL_INTERVAL):
+            if exited(proc):
+                self.quality_failed(q, 'ffmpeg computing the video quality '
+                                    'exited before the end of the run')
+                return
+
+    def cleanup_jobs(self):
         dst = os.path.join(self._log_dir, self._config.receiver_config.output)
         src = self._config.sender_config.input
-        out = self._log_dir
-        if os.path.isfile(src) and os.path.isfile(dst):
-            ffmpeg_vmaf = f'ffmpeg -hide_banner -i {dst} -i {src} '\
-                    f'-lavfi libvmaf=log_fmt=csv:' \
-                    f'log_path={out}/video_quality.csv:' \
-                    'psnr=1:ssim=1:eof_action=endall '\
-                    '-f null -'
-            print(f'ffmpeg cmd: "{ffmpeg_vmaf}"')
-            subprocess.run(ffmpeg_vmaf.split(' '))
-
-            # Alternative FFMPEG Command if vmaf is not required/too slow:
-            # ffmpeg_cmd = 'ffmpeg ' \
-            #     f'-i {dst} ' \
-            #     f'-i {src} ' \
-            #     '-lavfi ' \
-            #     f'ssim={out}/ssim.log:eof_action=endall;[0:v][1:v]' \
-            #     f'psnr={out}/psnr.log:eof_action=endall ' \
-            #     '-f null -'
-            # subprocess.run(ffmpeg_cmd.split(' '))
-
-        p = os.path.join(self._log_dir, self._config.receiver_config.output)
-        Path(p).unlink(missing_ok=True)
+        cmds = []
+        if self._quality_failed:
+            cmds = []
+        elif self.streams_quality():
+            # the first command already ran while streaming
+            cmds = self.quality_cmds(pipe=True)[1:]
+        elif os.path.isfile(src) and os.path.isfile(dst):
+            cmds = self.quality_cmds()
+
+        quality = self._config.receiver_config.quality
+        return [Job(
+            id=os.path.join(self._log_dir, 'video_quality'),
+            cmds=cmds,
+            remove=[dst] + intermediate_files(
+                quality.mode,
+                os.path.join(self._log_dir, 'video_quality.csv')),
+        )]
 
     def client_cmd(self, addr, port):
         cmd = [
@@ -0,0 +1,93 @@
+import heapq
+import itertools
+import time
+
+from threading import Condition, Thread
+
+
+class Scheduler():
+    def __init__(self, spin=0.002):
+        self._spin = spin
+        self._events = []
+        self._counter = itertools.count()
+        self._cond = Condition()
+        self._cancelled = False
+        self._thread = None
+        self._threads = []
+        self._start = None
+        self.fired = []
+
+    def enter(self, delay, name, func, blocking=False):
+        with self._cond:
+            heapq.heappush(
+                    self._events,
+                    (delay, next(self._counter), name, func, blocking))
+            self._cond.notify()
+
+    def start(self):
+        self._start = time.monotonic()
+        self._thread = Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self._start
+
+    def elapsed(self):
+        return time.monotonic() - self._start
+
+    def run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._cancelled:
+                        return
+                    if len(self._events) == 0:
+                        self._cond.wait()
+                        continue
+                    at = self._start + self._events[0][0]
+                    remaining = at - time.monotonic()
+                    if remaining <= self._spin:
+                        break
+                    self._cond.wait(remaining - self._spin)
+                delay, _, name, func, blocking = heapq.heappop(self._events)
+
+            # spin for the last few milliseconds, sleeping is too coarse
+            at = self._start + delay
+            while time.monotonic() < at:
+                pass
+
+            actual = self.elapsed()
+            event = {
+                'name': name,
+                'intended': round(delay * 1000, 3),
+                'actual': round(actual * 1000, 3),
+                'lateness': round((actual - delay) * 1000, 3),
+            }
+            self.fired.append(event)
+            if blocking:
+                t = Thread(target=func)
+                t.start()
+                self._threads.append(t)
+                continue
+            # a failing event, e.g. a tc command, must not stop the later
+            # ones, in particular the end of the run
+            try:
+                func()
+            except Exception as e:
+                print('scheduled event {} failed: {!r}'.format(name, e))
+                event['error'] = repr(e)
+
+    def cancel(self):
+        with self._cond:
+            self._cancelled = True
+            self._events = []
+            self._cond.notify()
+
+    def join(self):
+        self.cancel()
+        if self._thread is not None:
+            self._thread.join()
+        for t in self._threads:
+            t.join()
+
+    def events_json(self):
+        return list(self.fired)
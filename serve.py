@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+import argparse
+import glob
+import json
+import mimetypes
+import os
+import threading
+import urllib.parse
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pandas as pd
+
+from jinja2 import Environment, FileSystemLoader
+
+from analyze import index_configs, read_capacity, read_config_json, \
+    to_pretty_json
+from analyzers.fairness_analyzer import FairnessAnalyzer
+from analyzers.flow_analyzer import PLOTS, SingleFlowAnalyzer
+from analyzers.plot_cache import PlotCache
+from analyzers.rollup import read_rollup, rollup_names
+from analyzers.windows import RateWindow, add_rate_window_args, rate_window
+
+ALL_FLOWS = 'all'
+ROLLUPS = 'rollups'
+
+
+class LRU():
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = 0
+        self._items = OrderedDict()
+
+    def get(self, key):
+        if key not in self._items:
+            return None
+        self._items.move_to_end(key)
+        return self._items[key][0]
+
+    def put(self, key, value, size=1):
+        if key in self._items:
+            self.size -= self._items.pop(key)[1]
+        self._items[key] = (value, size)
+        self.size += size
+        # the newest item is kept even if it exceeds the capacity on its own
+        while self.size > self.capacity and len(self._items) > 1:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self.size -= evicted
+
+
+class Experiment():
+    def __init__(self, input_dir, output_dir, plot_cache=None,
+                 rate_window=RateWindow()):
+        self.config = read_config_json(os.path.join(input_dir, 'config.json'))
+        basetime = self.config.get('start_time')
+
+        link = None
+        link_file = next(iter(glob.glob(
+            input_dir + '/**/link.log', recursive=True)), None)
+        if link_file:
+            link = read_capacity(link_file)
+            link.index = pd.to_datetime(link.index - basetime, unit='ms')
+
+        self.flows = {}
+        for flow in self.config['flows']:
+            if 'id' not in flow:
+                continue
+            fa = SingleFlowAnalyzer(
+                    flow,
+                    os.path.join(output_dir, str(flow['id'])),
+                    basetime,
+                    plot_cache,
+                    rate_window,
+                )
+            fa.set_link_capacity(link)
+            fa.set_events(self.config.get('events', []))
+            fa.analyze()
+            self.flows[str(flow['id'])] = fa
+
+        self.fairness = None
+        if link is not None:
+            self.fairness = FairnessAnalyzer(output_dir, link, rate_window)
+            for id, fa in self.flows.items():
+                packets = fa.received_packets()
+                if packets is not None:
+                    self.fairness.add_flow(id, *packets)
+            self.fairness.analyze()
+
+    def plots(self):
+        plots = {id: PLOTS for id in self.flows}
+        if self.fairness is not None and self.fairness.rates is not None:
+            plots[ALL_FLOWS] = ['plot']
+        return plots
+
+    def render(self, flow, plot):
+        if flow == ALL_FLOWS:
+            analyzer = self.fairness
+        else:
+            analyzer = self.flows[flow]
+        Path(analyzer.output_dir).mkdir(parents=True, exist_ok=True)
+        before = len(analyzer.plot_files)
+        getattr(analyzer, plot)()
+        return {
+            os.path.basename(f): Path(f).read_bytes()
+            for f in analyzer.plot_files[before:]
+        }
+
+
+class ResultsServer():
+    # Serves the index and experiment pages from the input directory. Logs are
+    # parsed when an experiment is first opened, plots are rendered when they
+    # are first requested. Both are kept in LRU caches. <experiment>/<flow>/
+    # rollups lists a flow's time series, <experiment>/<flow>/rollups/<name>
+    # returns one as JSON, optionally zoomed by the start, end and points
+    # query parameters.
+    def __init__(self, input_dir, output_dir, plot_cache=None,
+                 experiments=8, image_bytes=256 * 1024 * 1024,
+                 rate_window=RateWindow()):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.plot_cache = plot_cache
+        self.rate_window = rate_window
+        self._experiments = LRU(experiments)
+        self._images = LRU(image_bytes)
+        # matplotlib's pyplot interface is not thread safe
+        self._lock = threading.Lock()
+        self._environment = Environment(loader=FileSystemLoader('templates/'))
+        self._environment.filters['tojson_pretty'] = to_pretty_json
+
+    def experiment_dir(self, parts):
+        for i in range(len(parts), 0, -1):
+            path = os.path.join(self.input_dir, *parts[:i])
+            if os.path.isfile(os.path.join(path, 'config.json')):
+                return '/'.join(parts[:i]), parts[i:]
+        return None, parts
+
+    def experiment(self, path):
+        experiment = self._experiments.get(path)
+        if experiment is None:
+            print('parsing {}'.format(path))
+            experiment = Experiment(
+                    os.path.join(self.input_dir, path),
+                    os.path.join(self.output_dir, path),
+                    self.plot_cache,
+                    self.rate_window,
+                )
+            self._experiments.put(path, experiment)
+        return experiment
+
+    def images(self, path, flow, plot):
+        key = (path, flow, plot)
+        images = self._images.get(key)
+        if images is None:
+            experiment = self.experiment(path)
+            if plot not in experiment.plots().get(flow, []):
+                return None
+            print('rendering {} {} {}'.format(path, flow, plot))
+            images = experiment.render(flow, plot)
+            self._images.put(key, images, sum(map(len, images.values())))
+        return images
+
+    def rollups(self, path, flow):
+        # rollups.npz of a flow, written when it is first requested
+        file = os.path.join(self.output_dir, path, flow, 'rollups.npz')
+        if not os.path.isfile(file):
+            experiment = self.experiment(path)
+            if flow not in experiment.flows:
+                return None
+            experiment.flows[flow].save_rollups()
+        return file
+
+    def rollup(self, path, flow, name, query):
+        # A time series at the resolution matching the requested span, in
+        # ms after the start of the run. Only that resolution is read.
+        file = self.rollups(path, flow)
+        if file is None:
+            return None
+        if name is None:
+            return json.dumps(rollup_names(file)).encode('utf-8')
+
+        def param(key):
+            value = query.get(key)
+            return None if value is None else int(value[0])
+
+        df = read_rollup(
+                file, name, param('start'), param('end'),
+                param('resolution'), param('points') or 2000)
+        if df is None:
+            return None
+        return json.dumps({
+            'resolution': int(df.attrs.get('resolution', 0)),
+            'time': [int(t) for t in
+                     (df.index - pd.Timestamp(0)) // pd.Timedelta('1ms')],
+        } | {
+            field: df[field].tolist() for field in df.columns
+        }).encode('utf-8')
+
+    def render(self, template, **context):
+        return self._environment.get_template(template).render(
+                context).encode('utf-8')
+
+    def index_page(self):
+        return self.render(
+                'index.html',
+                evaluated_configs=index_configs(
+                    self.input_dir, self.input_dir),
+            )
+
+    def experiment_page(self, path):
+        experiment = self.experiment(path)
+        return self.render(
+                'results_experiment.html',
+                path=path,
+                config=experiment.config,
+                flows=experiment.plots(),
+            )
+
+    def plot_page(self, path, flow, plot):
+        images = self.images(path, flow, plot)
+        if images is None:
+            return None
+        return self.render(
+                'results_plot.html',
+                path=path,
+                flow=flow,
+                plot=plot,
+                images=list(images),
+            )
+
+    def handle(self, url):
+        # returns the content type and body, or None if nothing matches
+        url = urllib.parse.urlsplit(url)
+        parts = [p for p in urllib.parse.unquote(url.path).split('/') if p]
+        if '..' in parts:
+            return None
+        if parts in ([], ['index.html']):
+            return 'text/html', self.index_page()
+
+        path, rest = self.experiment_dir(parts)
+        if path is None:
+            return None
+        with self._lock:
+            if rest in ([], ['index.html']):
+                return 'text/html', self.experiment_page(path)
+            if len(rest) in (2, 3) and rest[1] == ROLLUPS:
+                body = self.rollup(
+                        path, rest[0], (rest + [None])[2],
+                        urllib.parse.parse_qs(url.query))
+                return None if body is None else ('application/json', body)
+            if len(rest) == 2:
+                page = self.plot_page(path, *rest)
+                return None if page is None else ('text/html', page)
+            if len(rest) == 3:
+                images = self.images(path, rest[0], rest[1])
+                if images is None or rest[2] not in images:
+                    return None
+                return mimetypes.guess_type(rest[2])[0], images[rest[2]]
+        return None
+
+
+def request_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            try:
+                result = server.handle(self.path)
+            except Exception as e:
+                self.send_error(500, explain=repr(e))
+                raise
+            if result is None:
+                self.send_error(404)
+                return
+            content_type, body = result
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-i', '--input-dir', required=True,
+                        help='data directory written by test.py')
+    parser.add_argument('-o', '--output-dir', required=True,
+                        help='directory for plots rendered on demand')
+    parser.add_argument('--host', default='localhost',
+                        help='address to listen on')
+    parser.add_argument('--port', type=int, default=8000,
+                        help='port to listen on')
+    parser.add_argument('--experiments', type=int, default=8,
+                        help='number of parsed experiments kept in memory')
+    parser.add_argument('--image-cache-size', type=int, default=256,
+                        help='size of rendered images kept in memory in MiB')
+    parser.add_argument('--plot-cache',
+                        help='directory of a plot cache shared with '
+                        'analyze.py single')
+    parser.add_argument('--plot-cache-size', type=int, default=1024,
+                        help='maximum size of the plot cache in MiB')
+    add_rate_window_args(parser)
+    args = parser.parse_args()
+
+    plot_cache = None
+    if args.plot_cache is not None:
+        plot_cache = PlotCache(
+                args.plot_cache, args.plot_cache_size * 1024 * 1024)
+    server = ResultsServer(
+            args.input_dir,
+            args.output_dir,
+            plot_cache,
+            args.experiments,
+            args.image_cache_size * 1024 * 1024,
+            rate_window(args),
+        )
+    httpd = ThreadingHTTPServer(
+            (args.host, args.port), request_handler(server))
+    print('serving results on http://{}:{}/'.format(args.host, args.port))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+import argparse
+import itertools
+import json
+import os
+import shutil
+import time
+
+from pathlib import Path
+
+from mininet.log import setLogLevel
+
+from jobs import JobQueue
+from network import Network
+from test import Test, TestPlan, matches, parse_configs, \
+    parse_emulation_builders, parse_flow_builders, read_kpis, \
+    record_overhead
+
+
+def emulation_groups(emulation, parameter):
+    # Every combination of the remaining list valued parameters is swept
+    # separately.
+    config = emulation['config']
+    keys = [k for k, v in config.items()
+            if isinstance(v, list) and k != parameter]
+    for values in itertools.product(*[config[k] for k in keys]):
+        yield dict(config) | {k: [v] for k, v in zip(keys, values)}
+
+
+def next_point(points, min_step):
+    # Refine the interval in which the KPI changes most.
+    xs = sorted(points)
+    best = None
+    for a, b in zip(xs, xs[1:]):
+        if points[a] is None or points[b] is None or b - a < 2 * min_step:
+            continue
+        score = abs(points[b] - points[a])
+        if best is None or score > best[0]:
+            best = (score, (a + b) / 2)
+    return None if best is None else best[1]
+
+
+class AdaptiveSweep():
+    def __init__(self, args, config_id, config, job_queue, date,
+                 network=None):
+        self._args = args
+        self._config_id = config_id
+        self._config = config
+        self._job_queue = job_queue
+        self._date = date
+        self._network = network
+        self.results = []
+
+    def run_point(self, group, emulation, flows, value):
+        emu_config = emulation | {self._args.parameter: [value]}
+        builder = parse_emulation_builders(
+                self._config['emulation'] | {'config': emu_config})[0]
+        plan = TestPlan(
+                self._config_id,
+                f'{group}-{self._args.parameter}-{value:g}',
+                builder,
+                flows,
+            )
+        test_config = plan.build(self._args.data_dir, self._date)
+        start = time.time()
+        test = Test(
+            test_config,
+            live_analysis=True,
+            abort_after=self._args.abort_after,
+            job_queue=self._job_queue,
+            network=self._network,
+            drain=self._args.drain,
+        )
+        test.run()
+        record_overhead(
+                self._args.data_dir, time.time() - start - test.duration())
+        kpis = read_kpis(test_config)
+        kpi = None if kpis is None else kpis.get(self._args.kpi)
+        print('{}={} -> {}={}'.format(
+            self._args.parameter, value, self._args.kpi, kpi))
+        return kpi
+
+    def sweep_group(self, group, emulation, flows):
+        points = {}
+        initial = [self._args.min + i * (self._args.max - self._args.min) /
+                   max(1, self._args.initial - 1)
+                   for i in range(self._args.initial)]
+        for value in initial[:self._args.budget]:
+            points[value] = self.run_point(group, emulation, flows, value)
+
+        while len(points) < self._args.budget:
+            value = next_point(points, self._args.min_step)
+            if value is None:
+                break
+            points[value] = self.run_point(group, emulation, flows, value)
+        return points
+
+    def run(self):
+        emulations = emulation_groups(
+                self._config['emulation'], self._args.parameter)
+        groups = itertools.product(
+                emulations, parse_flow_builders(self._config['flows']))
+        for group, (emulation, flows) in enumerate(groups):
+            flows = list(flows)
+            plan = TestPlan(
+                    self._config_id,
+                    group,
+                    parse_emulation_builders(
+                        self._config['emulation'] | {'config': emulation | {
+                            self._args.parameter: [self._args.min]}})[0],
+                    flows,
+                )
+            parameters = plan.parameters()
+            if not matches(parameters, self._args.include,
+                           self._args.exclude):
+                continue
+            print('sweeping group {}: {}'.format(group, parameters))
+            points = self.sweep_group(group, emulation, flows)
+            self.results.append({
+                'group': group,
+                'parameters': parameters,
+                'points': [{
+                    self._args.parameter: x,
+                    self._args.kpi: points[x],
+                } for x in sorted(points)],
+            })
+            self.save()
+
+    def save(self):
+        path = os.path.join(
+                self._args.data_dir,
+                self._config_id,
+                f'sweep-{self._date}.json',
+            )
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({
+                'parameter': self._args.parameter,
+                'kpi': self._args.kpi,
+                'groups': self.results,
+            }, f)
+
+
+def parse_sweep_args():
+    parser = argparse.ArgumentParser(
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--log-level', default='output',
+                        help='log level for mininet')
+    parser.add_argument('--data-dir', default='data/',
+                        help='output directory for logfiles')
+    parser.add_argument('-c', '--config-file', default='./config.yaml',
+                        help='config file')
+    parser.add_argument('--config-id', required=True,
+                        help='root config to sweep, e.g. c-0')
+    parser.add_argument('--parameter', default='loss',
+                        help='numeric emulation parameter to sweep')
+    parser.add_argument('--min', type=float, required=True,
+                        help='lower bound of the parameter')
+    parser.add_argument('--max', type=float, required=True,
+                        help='upper bound of the parameter')
+    parser.add_argument('--min-step', type=float, default=0.05,
+                        help='smallest distance between two sampled points')
+    parser.add_argument('--kpi', default='utilization',
+                        choices=['utilization', 'latency_p95', 'loss'],
+                        help='KPI from kpis.json that guides the sweep')
+    parser.add_argument('--initial', type=int, default=3,
+                        help='number of evenly spaced initial points')
+    parser.add_argument('--budget', type=int, default=8,
+                        help='maximum number of runs per parameter group')
+    parser.add_argument('--include', action='append',
+                        help='only sweep groups matching this expression')
+    parser.add_argument('--exclude', action='append',
+                        help='skip groups matching this expression')
+    parser.add_argument('--abort-after', type=int, default=0,
+                        help='abort a run if a flow receives nothing for '
+                        'this many seconds, 0 disables')
+    parser.add_argument('--drain', type=float, default=2.0,
+                        help='seconds a run continues after all clients '
+                        'exited, negative values always run the full '
+                        'emulation runtime')
+    parser.add_argument('--jobs', type=int, default=2,
+                        help='number of background cleanup jobs')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_sweep_args()
+    setLogLevel(args.log_level)
+    date = str(int(time.time() * 1000))
+    configs = parse_configs(args.config_file)
+    Path(args.data_dir).mkdir(parents=True, exist_ok=True)
+    shutil.copy(args.config_file, args.data_dir)
+
+    job_queue = None
+    if args.jobs > 0:
+        job_queue = JobQueue(
+                os.path.join(args.data_dir, 'jobs.json'),
+                workers=args.jobs,
+            )
+    network = Network()
+    try:
+        AdaptiveSweep(
+            args, args.config_id, configs[args.config_id], job_queue, date,
+            network,
+        ).run()
+    finally:
+        network.stop()
+    if job_queue is not None:
+        print('waiting for background jobs')
+        job_queue.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 import argparse
+import datetime
+import functools
 import itertools
 import json
 import os
+import random
 import shutil
 import time
 import yaml
@@ -12,15 +15,28 @@ from typing import NamedTuple
 from threading import Event, Thread
 from queue import Queue
 
-from mininet.clean import cleanup
 from mininet.log import setLogLevel
-from mininet.net import Mininet
-from mininet.util import dumpNodeConnections
 
 import flow
 import emulation
 
+from analyzers.live_analyzer import LiveAnalyzer
+from analyzers.windows import RateWindow, add_rate_window_args, rate_window
+from jobs import JobQueue, run_job
+from monitor import ResourceMonitor
+from network import Network
+from scheduler import Scheduler
+
 PORT = 4242
+DEFAULT_OVERHEAD = 15
+# seconds to wait for the end of the schedule beyond the emulation runtime
+STOP_MARGIN = 10
+
+# two-sided 95% t-distribution quantiles by degrees of freedom
+T_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+        2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101,
+        2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052,
+        2.048, 2.045, 2.042]
 
 
 class TestConfig(NamedTuple):
@@ -32,29 +48,40 @@ def timestamp(t):
     return time.strftime('%X', time.localtime(t))
 
 
-def run_at(at, func):
-    t = time.time()
-    delay = at - t
-    if delay < 0:
-        return func()
-    time.sleep(delay)
-    return func()
-
-
 class Test:
-    def __init__(self, config):
+    def __init__(self, config, live_analysis=False, abort_after=0,
+                 job_queue=None, monitor_interval=0.1, network=None,
+                 drain=2.0, rate_window=RateWindow()):
         self.flows: flow.Flow = config.flows
         self.emulation: emulation.Emulation = config.emulation
+        self.job_queue = job_queue
+        self.live_analysis = live_analysis
+        self.abort_after = abort_after
+        self.live_analyzer = None
+        self.monitor_interval = monitor_interval
+        self.monitor = None
+        self.network = network if network is not None else \
+            Network(reuse=False)
+        self.drain = drain
+        self.rate_window = rate_window
+        self.start_time = None
+        self.end_time = None
+        self.clients_exited = None
 
     def setup_network(self):
-        topo = self.emulation.topology(len(self.flows))
-        self.net = Mininet(topo=topo, autoStaticArp=True)
-        dumpNodeConnections(self.net.hosts)
-        self.net.start()
+        self.net = self.network.start(
+                self.emulation.topology(len(self.flows)))
 
     def start_flows(self, q, e):
+        Path(self.emulation._log_dir).mkdir(parents=True, exist_ok=True)
+        self.monitor = ResourceMonitor(
+                self.emulation._log_dir, self.monitor_interval)
+        self.monitor.start()
+        self.emulation.set_monitor(self.monitor)
+        for f in self.flows:
+            f.set_monitor(self.monitor)
+
         self.server_threads = []
-        self.client_threads = []
         for f in self.flows:
             host = self.net.getNodeByName(f.server_node)
             t = Thread(
@@ -65,31 +92,69 @@ class Test:
             self.server_threads.append(t)
 
         self.emulation.set_log_queue(q)
-        self.emulation.tcpdump(self.net)
+        # all flows listen on PORT on their own hosts
+        self.emulation.tcpdump(self.net, [PORT])
         self.emulation.init_link_emulation(self.net)
-        self.start_time = time.time()
-
-        emulation_thread = Thread(
-                target=self.emulation.schedule_link_emulation,
-                args=(self.start_time, ))
-        emulation_thread.daemon = True
-        emulation_thread.start()
-        print('{} servers started'.format(timestamp(self.start_time)))
 
-        # TODO: Sort flows by delay?
+        self.emulation.schedule_link_emulation(self.scheduler)
         for f in self.flows:
             host = self.net.getNodeByName(f.receiver_node)
             server = self.net.getNodeByName(f.server_node)
-            at = self.start_time + f.delay
+            self.scheduler.enter(
+                    f.delay,
+                    'flow_{}_start'.format(f.id),
+                    functools.partial(
+                        f.start_client, q, e, host, server.IP(), PORT),
+                    blocking=True,
+                )
+        self.scheduler.enter(
+                self.emulation.runtime, 'stop', self.stop_event.set)
+
+        self.start_time = time.time()
+        self.scheduler.start()
+        print('{} servers started'.format(timestamp(self.start_time)))
+        for f in self.flows:
             print('{} schedule flow at: {}'.format(
-                timestamp(time.time()), timestamp(at)))
-            t = Thread(
-                    target=run_at,
-                    args=(
-                        at,
-                        lambda: f.start_client(q, e, host, server.IP(), PORT)))
-            t.start()
-            self.client_threads.append(t)
+                timestamp(time.time()), timestamp(self.start_time + f.delay)))
+
+        if self.live_analysis:
+            self.live_analyzer = LiveAnalyzer(
+                    self.emulation._log_dir,
+                    self.flows,
+                    int(self.start_time * 1000),
+                    self.abort_after,
+                    rate_window=self.rate_window,
+                )
+            self.live_analyzer.start(self.abort)
+
+        if self.drain >= 0 and len(self.flows) > 0:
+            watcher = Thread(target=self.watch_clients)
+            watcher.daemon = True
+            watcher.start()
+
+    def watch_clients(self):
+        # Ends the run once every client exited successfully and the drain
+        # period passed. The stop event of the schedule still ends the run at
+        # the latest.
+        for f in self.flows:
+            while not f.client_exited.is_set():
+                if self.stop_event.wait(0.1):
+                    return
+        self.clients_exited = time.time()
+        failed = [f.id for f in self.flows if f.client_returncode != 0]
+        if len(failed) > 0:
+            print('{} clients {} failed, running the full schedule'.format(
+                timestamp(self.clients_exited), failed))
+            return
+        print('{} all clients exited, draining for {}s'.format(
+            timestamp(self.clients_exited), self.drain))
+        if not self.stop_event.wait(self.drain):
+            self.stop_event.set()
+
+    def abort(self):
+        print('{} aborting run: {}'.format(
+            timestamp(time.time()), self.live_analyzer.abort_reason))
+        self.stop_event.set()
 
     def log_output_from_queue(self, q):
         while True:
@@ -108,7 +173,20 @@ class Test:
                 'end_time': int(self.end_time * 1000),
                 'emulation': self.emulation.config_json(),
                 'flows': flows,
+                'events': self.scheduler.events_json(),
             }
+        if self.live_analyzer is not None:
+            config['aborted'] = self.live_analyzer.abort_reason
+        if self.clients_exited is not None:
+            config['clients_exited'] = int(self.clients_exited * 1000)
+        returncodes = {str(f.id): f.client_returncode for f in self.flows
+                       if f.client_returncode is not None}
+        if len(returncodes) > 0:
+            config['client_returncodes'] = returncodes
+        errors = {str(f.id): f.errors for f in self.flows if f.errors}
+        if len(errors) > 0:
+            print('{} run failed: {}'.format(timestamp(time.time()), errors))
+            config['errors'] = errors
         path = self.emulation._log_dir
         print('saving config to {}'.format(path))
         self.emulation._log_dir
@@ -116,14 +194,21 @@ class Test:
         with open(os.path.join(path, 'config.json'), 'w') as file:
             json.dump(config, file)
 
-    def teardown_network(self):
-        self.net.stop()
-        cleanup()
+    def duration(self):
+        if self.start_time is None or self.end_time is None:
+            return self.emulation.runtime
+        return self.end_time - self.start_time
+
+    def teardown_network(self, clean=True):
+        self.network.release(clean)
 
     def run(self):
         cleanup = True
         io_queue = Queue()
         end_event = Event()
+        self.stop_event = Event()
+        self.scheduler = Scheduler()
+        self.server_threads = []
         iot = Thread(target=self.log_output_from_queue, args=(io_queue, ))
         iot.start()
         try:
@@ -133,17 +218,17 @@ class Test:
             end_time = self.start_time + self.emulation.runtime
             print('{} run until {}'.format(
                 timestamp(time.time()), timestamp(end_time)))
-            elapsed_time = time.time() - self.start_time
-            if elapsed_time > self.emulation.runtime:
-                print('error: scheduling delay larger than total runtime')
-
-            sleep_time = self.emulation.runtime - elapsed_time
-            print('{} sleep {}'.format(timestamp(time.time()), sleep_time))
-            time.sleep(sleep_time)
-            print('{} sleep done'.format(timestamp(time.time())))
+            # the scheduler sets the stop event, the timeout only guards
+            # against a scheduler that died
+            self.stop_event.wait(self.emulation.runtime + STOP_MARGIN)
+            print('{} stop'.format(timestamp(time.time())))
+            self.scheduler.cancel()
             self.emulation.close_link_emulation()
             self.end_time = time.time()
-            self.write_meta_info()
+            if self.live_analyzer is not None:
+                kpis = self.live_analyzer.stop(int(self.end_time * 1000))
+                print('{} kpis: {}'.format(
+                    timestamp(time.time()), kpis['kpis']))
         except Exception as e:
             print(e)
             cleanup = False
@@ -157,17 +242,30 @@ class Test:
             for thread in self.server_threads:
                 thread.join()
                 print('joined server')
-            for thread in self.client_threads:
-                thread.join()
-                print('joined client')
+            self.scheduler.join()
+            print('joined clients')
+            # after the joins, servers may record errors until they exit
+            if cleanup:
+                self.write_meta_info()
+            # close_link_emulation is skipped if the run failed, the
+            # captures must not outlive the run in a reused network
+            self.emulation.stop_capture()
+            if self.monitor is not None:
+                self.monitor.stop()
             if cleanup:
                 print('running cleanup')
+                jobs = self.emulation.cleanup_jobs()
                 for f in self.flows:
-                    f.cleanup()
+                    jobs.extend(f.cleanup_jobs())
+                for job in jobs:
+                    if self.job_queue is not None:
+                        self.job_queue.submit(job)
+                    else:
+                        run_job(job)
             io_queue.put(None)
             iot.join()
             print('joined iot')
-            self.teardown_network()
+            self.teardown_network(cleanup)
 
 
 def get_flow_builders(flow, host):
@@ -182,11 +280,11 @@ def get_flow_builders(flow, host):
 
 
 def parse_flow_builders(flows):
-    flow_sets: [[flow.FlowBuilder]] = [[]] * len(flows)
-    for i, f in enumerate(flows):
+    flow_sets: [[flow.FlowBuilder]] = []
+    for f in flows:
         mod = __import__(f['module'])
         flow_class = getattr(mod, f['name'])
-        flow_builders = [{
+        flow_sets.append([{
             'fb': fb,
             'count': f.get('count', 1),
             'server_side': f['server_side'],
@@ -194,11 +292,9 @@ def parse_flow_builders(flows):
             } for fb in flow_class.builders(
                 f['delay'],
                 f['config'],
-            )]
-        flow_sets[i] = flow_builders
+            )])
 
-    product = itertools.product(*flow_sets)
-    return list(product)
+    return itertools.product(*flow_sets)
 
 
 def parse_emulation_builders(emulation):
@@ -215,37 +311,153 @@ def parse_configs(file_name):
     return configs
 
 
-def build_test_config(file_name, data_dir, date):
-    configs = parse_configs(file_name)
-    Path(data_dir).mkdir(parents=True, exist_ok=True)
-    shutil.copy(file_name, data_dir)
-    tests = []
+class TestPlan(NamedTuple):
+    config_id: str
+    emulation_id: int
+    emulation: emulation.EmulationBuilder
+    flows: list
+
+    def build(self, data_dir, date):
+        emu_dir = os.path.join(
+                data_dir, self.config_id, f'e-{self.emulation_id}', date)
+        emulation = self.emulation.build(emu_dir, self.config_id)
+        return TestConfig(self.build_flows(emu_dir), emulation)
+
+    def build_flows(self, emu_dir):
+        flows = []
+        i = 0
+        for f in self.flows:
+            for _ in range(f['count']):
+                flows.append(f['fb'].build(
+                    i,
+                    f'{f["server_side"]}{i}',
+                    f'{f["receiver_side"]}{i}',
+                    os.path.join(emu_dir, 'f-{}'.format(i)),
+                ))
+                i += 1
+        return flows
+
+    def parameters(self):
+        # The emulation is not built, e.g. trace driven emulations would read
+        # their whole trace. Building flows only creates objects, no
+        # directories are created before a test is run.
+        runtime, emulation_parameters = self.emulation.parameters()
+        parameters = {
+            'config': self.config_id,
+            'runtime': runtime,
+        }
+        parameters.update(emulation_parameters)
+        for i, f in enumerate(self.build_flows('')):
+            for key, value in f.config_json().get('parameters', {}).items():
+                parameters[f'f{i}_{key.replace("-", "_")}'] = value
+        return parameters
+
+
+def matches(parameters, include, exclude):
+    def evaluate(expression):
+        try:
+            return bool(eval(expression, {'__builtins__': {}}, parameters))
+        except NameError:
+            return False
+
+    if include and not any(evaluate(e) for e in include):
+        return False
+    return not any(evaluate(e) for e in exclude or [])
+
+
+def iter_test_plans(configs, include=None, exclude=None):
     for config_id, config in configs.items():
-        config_name = f'{config_id}'
-        config_dir = os.path.join(data_dir, config_name)
         emu_builders = parse_emulation_builders(config['emulation'])
         flow_builders = parse_flow_builders(config['flows'])
         emu_x_flows = itertools.product(emu_builders, flow_builders)
 
         for id, x in enumerate(emu_x_flows):
-            emu_name = f'e-{id}'
-            emu_dir = os.path.join(config_dir, emu_name, date)
-            emulation = x[0].build(emu_dir, config_id)
-            flows = []
-            i = 0
-            for f in x[1]:
-                for _ in range(f['count']):
-                    flows.append(f['fb'].build(
-                        i,
-                        f'{f["server_side"]}{i}',
-                        f'{f["receiver_side"]}{i}',
-                        os.path.join(emu_dir, 'f-{}'.format(i)),
-                    ))
-                    i += 1
-
-            tc = TestConfig(flows, emulation)
-            tests.append(tc)
-    return tests
+            plan = TestPlan(f'{config_id}', id, x[0], list(x[1]))
+            if include or exclude:
+                if not matches(plan.parameters(), include, exclude):
+                    continue
+            yield plan
+
+
+def read_overhead(data_dir):
+    path = os.path.join(data_dir, 'overhead.json')
+    if not os.path.isfile(path):
+        return {'runs': 0, 'mean': DEFAULT_OVERHEAD}
+    with open(path) as f:
+        return json.load(f)
+
+
+def record_overhead(data_dir, overhead):
+    # overhead is measured against the actual run duration, which is shorter
+    # than the runtime for aborted or early ended runs
+    overhead = max(0, overhead)
+    o = read_overhead(data_dir)
+    runs = o['runs'] + 1
+    mean = overhead if o['runs'] == 0 else \
+        o['mean'] + (overhead - o['mean']) / runs
+    with open(os.path.join(data_dir, 'overhead.json'), 'w') as f:
+        json.dump({'runs': runs, 'mean': mean}, f)
+
+
+def read_kpis(test_config):
+    path = os.path.join(test_config.emulation._log_dir, 'kpis.json')
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        kpis = json.load(f)
+    if kpis.get('aborted') is not None:
+        return None
+    # runs with flow errors, e.g. a failed quality computation, are invalid
+    config = os.path.join(test_config.emulation._log_dir, 'config.json')
+    if os.path.isfile(config):
+        with open(config) as f:
+            if json.load(f).get('errors'):
+                return None
+    return kpis['kpis']
+
+
+def confidence_interval(values):
+    n = len(values)
+    mean = sum(values) / n
+    if n < 2:
+        return mean, float('inf')
+    variance = sum((x - mean) ** 2 for x in values) / (n - 1)
+    t = T_95[n - 2] if n - 2 < len(T_95) else 1.96
+    return mean, t * (variance / n) ** 0.5
+
+
+def confident(values, width):
+    mean, half_width = confidence_interval(values)
+    return 2 * half_width <= max(width * abs(mean), 1e-9)
+
+
+def dry_run(plans, data_dir, sample_size):
+    overhead = read_overhead(data_dir)
+    rng = random.Random(0)
+    sample = []
+    count = 0
+    runtime = 0
+    for plan in plans:
+        parameters = plan.parameters()
+        runtime += parameters['runtime']
+        if len(sample) < sample_size:
+            sample.append(parameters)
+        else:
+            j = rng.randrange(count + 1)
+            if j < sample_size:
+                sample[j] = parameters
+        count += 1
+
+    wall_time = runtime + count * overhead['mean']
+    print('{} test configs'.format(count))
+    print('estimated wall time: {} ({}s runtime, {:.1f}s overhead per run '
+          'measured over {} runs)'.format(
+            datetime.timedelta(seconds=int(wall_time)),
+            runtime,
+            overhead['mean'],
+            overhead['runs']))
+    for parameters in sample:
+        print(parameters)
 
 
 def parse_test_args():
@@ -267,20 +479,166 @@ def parse_test_args():
                         help='output directory for logfiles')
     parser.add_argument('-c', '--config-file', default='./config.yaml',
                         help='config file')
+    parser.add_argument('--include', action='append',
+                        help='only run test configs whose parameters match '
+                        'this python expression, e.g. "loss < 1 and '
+                        'f0_transport == \'udp\'", may be repeated')
+    parser.add_argument('--exclude', action='append',
+                        help='skip test configs whose parameters match this '
+                        'python expression, may be repeated')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print the number of test configs, the '
+                        'estimated wall time and a sample of configs '
+                        'without running anything')
+    parser.add_argument('--sample', type=int, default=5,
+                        help='number of configs printed by --dry-run')
+    parser.add_argument('--live-analysis', action='store_true',
+                        help='compute KPIs while the experiments run')
+    parser.add_argument('--abort-after', type=int, default=0,
+                        help='abort a run if a flow receives nothing for '
+                        'this many seconds, requires --live-analysis, '
+                        '0 disables')
+    parser.add_argument('--monitor-interval', type=float, default=0.1,
+                        help='seconds between two samples of the resource '
+                        'usage of all started processes, 0 only records '
+                        'the final rusage')
+    add_rate_window_args(parser)
+    parser.add_argument('--repeat-until-ci', action='store_true',
+                        help='repeat each test config until the 95%% '
+                        'confidence intervals of --ci-kpis are narrow '
+                        'enough, implies --live-analysis')
+    parser.add_argument('--ci-kpis', nargs='+',
+                        default=['utilization', 'latency_p95', 'loss'],
+                        choices=['utilization', 'latency_p95', 'loss'],
+                        help='KPIs whose confidence intervals are checked')
+    parser.add_argument('--ci-width', type=float, default=0.1,
+                        help='target width of the confidence interval '
+                        'relative to the mean')
+    parser.add_argument('--min-repetitions', type=int, default=3,
+                        help='minimum number of repetitions')
+    parser.add_argument('--max-repetitions', type=int, default=10,
+                        help='maximum number of repetitions')
+    parser.add_argument('--jobs', type=int, default=2,
+                        help='number of background cleanup jobs (e.g. VMAF) '
+                        'running in parallel to the experiments, 0 runs '
+                        'them synchronously after each run')
+    parser.add_argument('--drain', type=float, default=2.0,
+                        help='seconds a run continues after all clients '
+                        'exited, negative values always run the full '
+                        'emulation runtime')
+    parser.add_argument('--fresh-network', action='store_true',
+                        help='build and tear down the mininet network for '
+                        'every run instead of reusing it for consecutive '
+                        'test configs with the same topology')
     args = parser.parse_args()
+    if args.repeat_until_ci:
+        args.live_analysis = True
     return args
 
 
+def run_test(plan, args, job_queue, date, network=None):
+    test_config = plan.build(args.data_dir, date)
+    start = time.time()
+    test = Test(
+        test_config,
+        live_analysis=args.live_analysis,
+        abort_after=args.abort_after,
+        job_queue=job_queue,
+        monitor_interval=args.monitor_interval,
+        network=network,
+        drain=args.drain,
+        rate_window=rate_window(args),
+    )
+    test.run()
+    record_overhead(args.data_dir, time.time() - start - test.duration())
+    return test_config
+
+
+def run_until_confident(plan, args, job_queue, network=None):
+    values = {kpi: [] for kpi in args.ci_kpis}
+    repetitions = 0
+    valid = 0
+    while repetitions < args.max_repetitions:
+        date = str(int(time.time() * 1000))
+        test_config = run_test(plan, args, job_queue, date, network)
+        repetitions += 1
+        kpis = read_kpis(test_config)
+        if kpis is None:
+            print('no KPIs for repetition {}'.format(repetitions))
+            continue
+        valid += 1
+        for kpi in args.ci_kpis:
+            if kpis.get(kpi) is not None:
+                values[kpi].append(kpis[kpi])
+
+        # KPIs a config does not produce, e.g. RTP latency for iperf3 flows,
+        # are not waited for
+        checked = {kpi: v for kpi, v in values.items()
+                   if len(v) > 0 or valid < args.min_repetitions}
+        if valid == args.min_repetitions:
+            for kpi in values.keys() - checked.keys():
+                print('{} not produced by this config, ignoring it'.format(
+                    kpi))
+        if all(len(v) >= args.min_repetitions and confident(v, args.ci_width)
+               for v in checked.values()):
+            break
+
+    summary = {'repetitions': repetitions, 'kpis': {}}
+    for kpi, v in values.items():
+        if len(v) == 0:
+            continue
+        mean, half_width = confidence_interval(v)
+        summary['kpis'][kpi] = {
+            'values': v,
+            'mean': mean,
+            'ci95': half_width if len(v) > 1 else None,
+        }
+        print('{}: {} +- {} after {} repetitions'.format(
+            kpi, mean, half_width, len(v)))
+    path = os.path.join(
+            args.data_dir,
+            plan.config_id,
+            f'e-{plan.emulation_id}',
+            'repetitions.json',
+        )
+    # the directory is missing if no run got far enough to write logs
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(summary, f)
+
+
 def main():
     args = parse_test_args()
     setLogLevel(args.log_level)
     date = str(int(time.time() * 1000))
-    test_configs = build_test_config(args.config_file, args.data_dir, date)
-    print('running {} test configs'.format(len(test_configs)))
-    for i, test_config in enumerate(test_configs):
-        print('running test config {}/{}'.format(i+1, len(test_configs)))
-        Test(test_config).run()
-        print()
+    configs = parse_configs(args.config_file)
+    plans = iter_test_plans(configs, args.include, args.exclude)
+    if args.dry_run:
+        dry_run(plans, args.data_dir, args.sample)
+        return
+
+    Path(args.data_dir).mkdir(parents=True, exist_ok=True)
+    shutil.copy(args.config_file, args.data_dir)
+    job_queue = None
+    if args.jobs > 0:
+        job_queue = JobQueue(
+                os.path.join(args.data_dir, 'jobs.json'),
+                workers=args.jobs,
+            )
+    network = Network(reuse=not args.fresh_network)
+    try:
+        for i, plan in enumerate(plans):
+            print('running test config {}'.format(i+1))
+            if args.repeat_until_ci:
+                run_until_confident(plan, args, job_queue, network)
+            else:
+                run_test(plan, args, job_queue, date, network)
+            print()
+    finally:
+        network.stop()
+    if job_queue is not None:
+        print('waiting for background jobs')
+        job_queue.wait()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,8 @@
+import os
+import sys
+
+import matplotlib
+
+# the modules of the testbed are not installed as a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+matplotlib.use('Agg')
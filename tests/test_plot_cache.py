@@ -0,0 +1,75 @@
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from analyzers.plot_cache import PlotCache, cached_plot, data_hash
+from analyzers.rtcp_analyzer import RTCPAnalyzer
+
+
+class Plotter():
+    def __init__(self, output_dir, plot_cache, frame, series):
+        self.output_dir = output_dir
+        self.plot_cache = plot_cache
+        self.plot_files = []
+        self.frame = frame
+        self.series = series
+        self.rendered = 0
+
+    def input_hash(self, name):
+        return data_hash(getattr(self, name))
+
+    def render(self, name, data):
+        self.rendered += 1
+        fig, ax = plt.subplots()
+        data.plot(ax=ax)
+        file = os.path.join(self.output_dir, name)
+        self.plot_files.append(file)
+        fig.savefig(file)
+        plt.close(fig)
+
+    @cached_plot(['frame'])
+    def plot_frame(self):
+        self.render('frame.png', self.frame)
+
+    @cached_plot(['series'])
+    def plot_series(self):
+        self.render('series.png', self.series)
+
+
+def plotter(tmp_path, name):
+    index = pd.to_datetime(np.arange(10) * 100, unit='ms')
+    return Plotter(
+            str(tmp_path / name),
+            PlotCache(str(tmp_path / 'cache')),
+            pd.DataFrame({'rate': np.arange(10.0)}, index=index),
+            pd.Series(np.arange(10.0), index=index, name='rate'),
+        )
+
+
+def test_cached_plots_miss_then_hit(tmp_path):
+    for plot, name in [('plot_frame', 'frame.png'),
+                       ('plot_series', 'series.png')]:
+        first = plotter(tmp_path, 'first')
+        os.makedirs(first.output_dir, exist_ok=True)
+        getattr(first, plot)()
+        assert first.rendered == 1
+
+        second = plotter(tmp_path, 'second')
+        getattr(second, plot)()
+        assert second.rendered == 0
+        assert second.plot_files == [os.path.join(second.output_dir, name)]
+        with open(first.plot_files[0], 'rb') as a, \
+                open(second.plot_files[0], 'rb') as b:
+            assert a.read() == b.read()
+
+
+def test_hash_covers_ndarray_attributes():
+    a = RTCPAnalyzer()
+    a.times, a.sizes = np.array([0, 10, 20]), np.array([80.0, 80.0, 80.0])
+    b = RTCPAnalyzer()
+    b.times, b.sizes = np.array([0, 10, 30]), np.array([80.0, 80.0, 80.0])
+    assert data_hash(a) != data_hash(b)
+    b.times = a.times.copy()
+    assert data_hash(a) == data_hash(b)
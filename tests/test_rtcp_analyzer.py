@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from analyzers.rtcp_analyzer import RTCPAnalyzer
+from analyzers.windows import to_ms
+
+
+def reaction_times_loop(rtcp, target, threshold, horizon):
+    values = target.to_numpy(dtype=float)
+    times = to_ms(target.index)
+    reactions = []
+    for t in rtcp.times:
+        i = np.searchsorted(times, t, side='right')
+        if i == 0:
+            continue
+        baseline = values[i - 1]
+        end = np.searchsorted(times, t + horizon, side='right')
+        changed = np.flatnonzero(np.abs(values[i:end] - baseline) >
+                                 threshold * abs(baseline))
+        if len(changed) > 0:
+            reactions.append(times[i + changed[0]] - t)
+    return np.asarray(reactions, dtype=float)
+
+
+def random_analyzer(rng, reports, samples):
+    rtcp = RTCPAnalyzer()
+    rtcp.times = np.sort(rng.integers(0, 60000, reports))
+    times = np.sort(rng.choice(np.arange(100, 60000), samples, replace=False))
+    # mostly small adjustments with occasional larger steps, zeros and gaps
+    values = 1e6 * np.exp(np.cumsum(rng.normal(0, 0.03, samples)))
+    values[rng.random(samples) < 0.05] = 0
+    values[rng.random(samples) < 0.02] = np.nan
+    target = pd.Series(values, index=pd.to_datetime(times, unit='ms'))
+    return rtcp, target
+
+
+def test_reaction_times_match_loop():
+    rng = np.random.default_rng(1)
+    for reports, samples in [(1000, 50), (5000, 3000), (200, 1), (10, 0)]:
+        rtcp, target = random_analyzer(rng, reports, samples)
+        for threshold, horizon in [(0.05, 1000), (0.01, 50), (0.5, 5000)]:
+            np.testing.assert_array_equal(
+                rtcp.reaction_times(target, threshold, horizon),
+                reaction_times_loop(rtcp, target, threshold, horizon))
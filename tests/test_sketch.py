@@ -0,0 +1,33 @@
+import numpy as np
+
+from analyzers.sketch import DDSketch, rolling_quantiles
+from analyzers.windows import RateWindow
+
+QS = [0.5, 0.95, 0.99]
+
+
+def test_rolling_quantiles_match_sketch_with_zeros():
+    rng = np.random.default_rng(0)
+    values = rng.exponential(5, 2000)
+    # sub-millisecond latencies are logged as 0
+    values[rng.random(2000) < 0.6] = 0
+    times = np.sort(rng.integers(0, 1000, 2000))
+
+    sketch = DDSketch()
+    sketch.add(values)
+    _, rolling = rolling_quantiles(times, values, RateWindow(1000, 1000), QS)
+
+    assert rolling.shape == (len(QS), 1)
+    for q, value in zip(QS, rolling[:, 0]):
+        expected = sketch.quantile(q)
+        if expected == 0:
+            assert value == 0
+        else:
+            # the sketch clamps to the observed minimum and maximum
+            assert np.isclose(value, expected, rtol=0.02)
+
+
+def test_rolling_quantiles_of_zeros_only():
+    _, rolling = rolling_quantiles(
+            np.arange(10), np.zeros(10), RateWindow(1000, 1000), QS)
+    assert (rolling == 0).all()
@@ -0,0 +1,214 @@
+import itertools
+import math
+import os
+
+import numpy as np
+
+from emulation import CaptureConfig, EmulationBuilder, LinkConfig
+from variable_available_capacity import VariableAvailableCapacity
+
+MTU = 1500
+MIN_BANDWIDTH = 8000
+
+
+class TraceCapacityBuilder(EmulationBuilder):
+    def __init__(self, trace, trace_format, granularity, runtime, loss, delay,
+                 latency, link_control='tc-batch', capture=CaptureConfig()):
+        self._trace = trace
+        self._trace_format = trace_format
+        self._granularity = granularity
+        self._runtime = runtime
+        self._loss = loss
+        self._delay = delay
+        self._latency = latency
+        self._link_control = link_control
+        self._capture = capture
+
+    def build(self, log_dir, config_id):
+        return TraceCapacity(
+                log_dir,
+                config_id,
+                self._trace,
+                self._trace_format,
+                self._granularity,
+                self._runtime,
+                self._loss,
+                self._delay,
+                self._latency,
+                self._link_control,
+                self._capture,
+            )
+
+    def parameters(self):
+        # without reading and compacting the whole trace
+        runtime = self._runtime
+        if runtime is None:
+            runtime = trace_runtime(
+                    self._trace, self._trace_format, self._granularity)
+        return runtime, {
+            'trace': os.path.basename(self._trace),
+            'granularity': self._granularity,
+            'loss': self._loss,
+            'delay': self._delay,
+            'latency': self._latency,
+        }
+
+
+class TraceCapacity(VariableAvailableCapacity):
+    def __init__(self, log_dir, config_id, trace, trace_format='mahimahi',
+                 granularity=100, runtime=None, loss=0, delay=0, latency=300,
+                 link_control='tc-batch', capture=CaptureConfig()):
+        VariableAvailableCapacity.__init__(
+                self, log_dir, config_id, loss, delay, latency, link_control,
+                capture)
+        self._trace = trace
+        self._trace_format = trace_format
+        self._granularity = granularity
+        if trace_format == 'mahimahi':
+            times, rates = read_mahimahi_trace(trace, granularity, runtime)
+        elif trace_format == 'csv':
+            times, rates = read_csv_trace(trace, granularity, runtime)
+        else:
+            raise ValueError('unknown trace format: {}'.format(trace_format))
+        self._times, self._rates = compact_trace(times, rates)
+        if runtime is None:
+            runtime = math.ceil((times[-1] + granularity) / 1000)
+        self._runtime = runtime
+        self._link_configs = []
+        self._remaining_configs = []
+
+    @staticmethod
+    def builders(config):
+        configs = itertools.product(
+                config['trace'],
+                config.get('granularity', [100]),
+                config.get('loss', [0]),
+                config.get('delay', [0]),
+                config.get('latency', [0]),
+            )
+        return [
+            TraceCapacityBuilder(
+                c[0],
+                config.get('format', 'mahimahi'),
+                c[1],
+                config.get('runtime', None),
+                c[2], c[3], c[4],
+                config.get('link_control', 'tc-batch'),
+                CaptureConfig(**config.get('capture', {})),
+            ) for c in configs]
+
+    def config_json(self):
+        return {
+            'config_id': self._config_id,
+            'name': 'TraceCapacity',
+            'runtime': self._runtime,
+            'trace': self._trace,
+            'format': self._trace_format,
+            'updates': len(self._times),
+            'link_control': self.link_control_json(),
+            'capture': self.capture_json(),
+            'parameters': {
+                'trace': os.path.basename(self._trace),
+                'granularity': self._granularity,
+                'loss': self._loss,
+                'delay': self._delay,
+                'latency': self._latency,
+            },
+        }
+
+    def link_config(self, i):
+        return LinkConfig(
+                self._times[i] / 1000,
+                int(self._rates[i]),
+                self._loss,
+                self._delay,
+                self._latency,
+            )
+
+    def init_link_emulation(self, net):
+        s1, s2 = net.getNodeByName('ls1', 'rs1')
+        self.s1_iface = s1.intf('ls1-eth1')
+        self.s2_iface = s2.intf('rs1-eth1')
+
+        self.update_link(self.link_config(0))
+        self._tc_cmd = 'change'
+
+    def get_link_update_cmds(self, config):
+        if self._tc_cmd == 'add':
+            return VariableAvailableCapacity.get_link_update_cmds(
+                    self, config)
+
+        # delay and loss are constant, only the tbf rate changes
+        return ['tc qdisc '
+                f'change dev {iface} parent 1: handle 2: '
+                f'tbf rate {config.bandwidth}bit burst 15000 '
+                f'latency {config.latency}ms'
+                for iface in [self.s1_iface, self.s2_iface]]
+
+    def schedule_link_emulation(self, scheduler):
+        self.schedule_update(scheduler, 1)
+
+    def schedule_update(self, scheduler, i):
+        # Each update enters the next one to keep the scheduler's queue short
+        # for traces with thousands of steps.
+        if i >= len(self._times) or self._times[i] >= self._runtime * 1000:
+            return
+
+        def f():
+            self.update_link(self.link_config(i))
+            self.schedule_update(scheduler, i + 1)
+
+        scheduler.enter(self._times[i] / 1000, 'link_update', f)
+
+
+def read_mahimahi_trace(file, granularity, runtime=None):
+    # Each line is the ms timestamp of one MTU sized delivery opportunity. The
+    # trace repeats once its last timestamp is reached.
+    opportunities = np.loadtxt(file, dtype=np.int64, ndmin=1)
+    period = int(opportunities[-1])
+    duration = period if runtime is None else runtime * 1000
+    repeats = math.ceil(duration / period)
+    opportunities = np.concatenate([
+        opportunities + i * period for i in range(repeats)])
+    opportunities = opportunities[opportunities < duration]
+
+    bins = math.ceil(duration / granularity)
+    counts = np.bincount(opportunities // granularity, minlength=bins)[:bins]
+    rates = counts * MTU * 8 * 1000 // granularity
+    times = np.arange(bins, dtype=np.int64) * granularity
+    return times, rates
+
+
+def read_csv_trace(file, granularity, runtime=None):
+    # Rows are 'time in ms,bandwidth in bit/s', each rate holds until the next
+    # row.
+    trace = np.loadtxt(file, delimiter=',', comments='#', ndmin=2)
+    trace_times = trace[:, 0].astype(np.int64)
+    trace_rates = trace[:, 1].astype(np.int64)
+    duration = trace_times[-1] + granularity if runtime is None \
+        else runtime * 1000
+
+    times = np.arange(0, duration, granularity, dtype=np.int64)
+    index = np.searchsorted(trace_times, times, side='right') - 1
+    rates = trace_rates[np.maximum(index, 0)]
+    return times, rates
+
+
+def trace_runtime(file, trace_format, granularity):
+    # Runtime of a trace without a configured runtime, from its last line
+    # only. Matches the runtime of TraceCapacity.
+    with open(file, 'rb') as f:
+        f.seek(max(0, os.path.getsize(file) - 4096))
+        lines = [line for line in f.read().splitlines()
+                 if line.strip() and not line.startswith(b'#')]
+    last = int(float(lines[-1].split(b',')[0]))
+    duration = last if trace_format == 'mahimahi' else last + granularity
+    bins = math.ceil(duration / granularity)
+    return math.ceil(bins * granularity / 1000)
+
+
+def compact_trace(times, rates):
+    rates = np.maximum(rates, MIN_BANDWIDTH)
+    keep = np.ones(len(rates), dtype=bool)
+    keep[1:] = rates[1:] != rates[:-1]
+    return times[keep], rates[keep]
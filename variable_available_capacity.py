@@ -1,17 +1,19 @@
 import itertools
-import os
-import sched
-import subprocess
-import time
 
-from emulation import DumbbellTopo, Emulation, EmulationBuilder, LinkConfig
+from emulation import CaptureConfig, DumbbellTopo, Emulation, \
+    EmulationBuilder, LinkConfig
+
+RUNTIME = 100
 
 
 class VariableAvailableCapacityBuilder(EmulationBuilder):
-    def __init__(self, loss, delay, latency):
+    def __init__(self, loss, delay, latency, link_control='tc-batch',
+                 capture=CaptureConfig()):
         self._loss = loss
         self._delay = delay
         self._latency = latency
+        self._link_control = link_control
+        self._capture = capture
 
     def build(self, log_dir, config_id):
         return VariableAvailableCapacity(
@@ -20,15 +22,25 @@ class VariableAvailableCapacityBuilder(EmulationBuilder):
                 self._loss,
                 self._delay,
                 self._latency,
+                self._link_control,
+                self._capture,
             )
 
+    def parameters(self):
+        return RUNTIME, {
+            'loss': self._loss,
+            'delay': self._delay,
+            'latency': self._latency,
+        }
+
 
 class VariableAvailableCapacity(Emulation):
-    def __init__(self, log_dir, config_id, loss=0, delay=0, latency=300):
-        Emulation.__init__(self, log_dir, config_id)
+    def __init__(self, log_dir, config_id, loss=0, delay=0, latency=300,
+                 link_control='tc-batch', capture=CaptureConfig()):
+        Emulation.__init__(self, log_dir, config_id, link_control, capture)
         self._tc_cmd = 'add'
         self._reference_bandwidth = 1.0
-        self._runtime = 100
+        self._runtime = RUNTIME
         self._loss = loss
         self._delay = delay
         self._latency = latency
@@ -48,13 +60,15 @@ class VariableAvailableCapacity(Emulation):
         loss_configs = config.get('loss', [0])
         delay_configs = config.get('delay', [0])
         latency_configs = config.get('latency', [0])
+        link_control = config.get('link_control', 'tc-batch')
+        capture = CaptureConfig(**config.get('capture', {}))
         configs = itertools.product(
                 loss_configs, delay_configs, latency_configs)
 
         emulation_builders: [VariableAvailableCapacityBuilder] = []
         for i, config in enumerate(configs):
             emulation_builders.append(VariableAvailableCapacityBuilder(
-                config[0], config[1], config[2],
+                config[0], config[1], config[2], link_control, capture,
             ))
         return emulation_builders
 
@@ -67,6 +81,8 @@ class VariableAvailableCapacity(Emulation):
                 'time': x.start_time,
                 'capacity': x.bandwidth,
             } for x in self._link_configs],
+            'link_control': self.link_control_json(),
+            'capture': self.capture_json(),
             'parameters': {
                 'loss': self._loss,
                 'delay': self._delay,
@@ -107,22 +123,13 @@ class VariableAvailableCapacity(Emulation):
             self.update_link(config)
         return f
 
-    def schedule_link_emulation(self, start_time):
-        scheduler = sched.scheduler(time.time, time.sleep)
+    def schedule_link_emulation(self, scheduler):
         for config in self._remaining_configs:
-            scheduler.enterabs(
-                    start_time + config.start_time,
-                    0,
+            scheduler.enter(
+                    config.start_time,
+                    'link_update',
                     self.update_link_func(config),
                 )
-        scheduler.run()
-
-    def tcpdump(self, net):
-        s1, s2 = 'ls1-eth1', 'rs1-eth1'
-        template = 'tcpdump ip -i {} -s 88 -w {}'
-        FNULL = open(os.devnull, 'w')
-        for s in [s1, s2]:
-            cmd = template.format(
-                    s,
-                    os.path.join(self._log_dir, '{}.pcap'.format(s)))
-            subprocess.Popen(cmd.split(' '), stderr=FNULL)
+
+    def capture_interfaces(self):
+        return ['ls1-eth1', 'rs1-eth1']
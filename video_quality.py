@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+import argparse
+import csv
+import os
+import sys
+
+QUALITY_MODES = ['vmaf', 'vmaf-fast', 'psnr-ssim', 'off']
+# absolute, the commands may run from another working directory
+SCRIPT = os.path.abspath(__file__)
+
+
+def input_args(distorted, reference, pipe):
+    # A pipe can't be probed, the receiver always writes y4m.
+    args = ['-f', 'yuv4mpegpipe'] if pipe else []
+    return args + ['-i', distorted, '-i', reference]
+
+
+def libvmaf_cmd(distorted, reference, csv_file, options='', pipe=False):
+    return ['ffmpeg', '-hide_banner'] + \
+           input_args(distorted, reference, pipe) + \
+           ['-lavfi', f'libvmaf=log_fmt=csv:log_path={csv_file}:'
+            f'psnr=1:ssim=1:eof_action=endall{options}',
+            '-f', 'null', '-']
+
+
+def psnr_ssim_logs(csv_file):
+    return csv_file + '.psnr.log', csv_file + '.ssim.log'
+
+
+def psnr_ssim_cmds(distorted, reference, csv_file, pipe=False):
+    psnr_log, ssim_log = psnr_ssim_logs(csv_file)
+    return [
+        ['ffmpeg', '-hide_banner'] +
+        input_args(distorted, reference, pipe) +
+        ['-lavfi', '[0:v]split[d0][d1];[1:v]split[r0][r1];'
+         f'[d0][r0]psnr=stats_file={psnr_log}:eof_action=endall;'
+         f'[d1][r1]ssim=stats_file={ssim_log}:eof_action=endall',
+         '-f', 'null', '-'],
+        [sys.executable, SCRIPT, 'merge',
+         '--psnr', psnr_log, '--ssim', ssim_log, '-o', csv_file],
+    ]
+
+
+def quality_cmds(mode, threads, subsample, distorted, reference, csv_file,
+                 pipe=False):
+    if mode == 'vmaf':
+        return [libvmaf_cmd(distorted, reference, csv_file, pipe=pipe)]
+    if mode == 'vmaf-fast':
+        options = f':n_subsample={subsample}'
+        if threads > 0:
+            options += f':n_threads={threads}'
+        return [libvmaf_cmd(
+            distorted, reference, csv_file, options, pipe=pipe)]
+    if mode == 'psnr-ssim':
+        return psnr_ssim_cmds(distorted, reference, csv_file, pipe=pipe)
+    if mode == 'off':
+        return []
+    raise ValueError('unknown quality mode: {}'.format(mode))
+
+
+def intermediate_files(mode, csv_file):
+    # files written by quality_cmds besides csv_file
+    if mode == 'psnr-ssim':
+        return list(psnr_ssim_logs(csv_file))
+    return []
+
+
+def read_stats(file, key):
+    values = {}
+    with open(file) as f:
+        for line in f:
+            fields = dict(
+                    field.split(':', 1) for field in line.split()
+                    if ':' in field)
+            values[int(fields['n']) - 1] = fields[key]
+    return values
+
+
+def merge_psnr_ssim(psnr_log, ssim_log, csv_file):
+    # Write the ffmpeg psnr/ssim stats in the same CSV layout as libvmaf, with
+    # luma values as in libvmaf's psnr and ssim features.
+    psnr = read_stats(psnr_log, 'psnr_y')
+    ssim = read_stats(ssim_log, 'Y')
+    with open(csv_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Frame', 'psnr', 'ssim'])
+        for frame in sorted(psnr.keys() & ssim.keys()):
+            writer.writerow([frame, psnr[frame], ssim[frame]])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers()
+    merge = subparsers.add_parser(
+            'merge',
+            help='merge ffmpeg psnr and ssim stats files into a CSV file')
+    merge.add_argument('--psnr', required=True)
+    merge.add_argument('--ssim', required=True)
+    merge.add_argument('-o', '--output', required=True)
+    merge.set_defaults(func=lambda args: merge_psnr_ssim(
+        args.psnr, args.ssim, args.output))
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()